@@ -1,13 +1,34 @@
 # ai_analysis.py
+import asyncio
+import hashlib
 import json
-from typing import Dict, Any
-from openai import OpenAI
-from app.config import OPEN_API_KEY
-from app.utils import resolve_ticker
-from app.services import fetch_stock_data, fetch_stock_fundamentals, fetch_analyst_recommendations, fetch_stock_news
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional
+from app.config import (TOOL_CONCURRENCY, TOOL_OUTPUT_FORMAT, AI_MAX_TURNS, AI_MAX_PROMPT_TOKENS,
+                        AI_DIGEST_THRESHOLD_TOKENS, SENTIMENT_ARTICLES_PER_SYMBOL, SENTIMENT_SCORE_TTL,
+                        SENTIMENT_SCORE_MAXSIZE, PORTFOLIO_MAX_SYMBOLS, PORTFOLIO_TOOL_MAX_SYMBOLS,
+                        AI_ROUTER_ENABLED, AI_ROUTER_MIN_CONFIDENCE)
+from app.cache import named_cache
+from app.utils import expand_symbols, resolve_ticker
+from app.services import (fetch_stock_data, fetch_stock_fundamentals, fetch_analyst_recommendations,
+                          fetch_stock_news, fetch_portfolio_analytics, compact_article)
+from app.intent_router import Route, parse_query
+from app.llm_cache import cached_completion
 from app.logger import logger
+from app.metrics import AI_TOOL_TURNS, QUERY_ROUTES, STAGE_LATENCY, request_tokens_var, timed
+from app.providers import get_llm_client
+from app.token_budget import TokenBudget
 
-client = OpenAI(api_key=OPEN_API_KEY)
+# Bounds how many tool calls run in worker threads at once across all requests
+_tool_semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+# Mean article score at or beyond which a symbol's news reads as bullish or bearish
+SENTIMENT_THRESHOLD = 0.15
+# (article content hash, symbol) -> sentiment score in [-1, 1]
+_article_scores = named_cache("sentiment_scores", SENTIMENT_SCORE_MAXSIZE, SENTIMENT_SCORE_TTL)
+# (symbol, hash of its scored articles) -> valuation verdict
+_valuations = named_cache("sentiment_valuations", SENTIMENT_SCORE_MAXSIZE, SENTIMENT_SCORE_TTL)
+VALUATIONS = ("overvalued", "undervalued", "fairly valued")
 
 # Tools for OpenAI function calling
 tools = [
@@ -86,75 +107,474 @@ tools = [
                 "required": ["symbol"]
             },
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "analyze_portfolio",
+            "description": (
+                "Compare several stocks in one call: total and index-relative returns, relative-strength ranks, "
+                "volatility, beta against the market index, drawdown and correlation. Use this instead of "
+                "fetch_stock_data per symbol when the user asks about a group (e.g. FAANG) or compares symbols."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "symbols": {
+                        "type": "string",
+                        "description": "Comma-separated tickers and/or acronym groups (e.g. 'FAANG' or 'AAPL,MSFT,NVDA')."
+                    },
+                    "start_date": {"type": "string"},
+                    "end_date": {"type": "string"}
+                },
+                "required": ["symbols"]
+            },
+        }
     }
 ]
 
-def analyze_stock_trends(stock_data):
+@timed("analyze_stock_trends")
+def analyze_stock_trends(stock_data, include_raw_bars: bool = False, interval: str = "1d"):
     logger.info("Generating AI stock trend analysis")
-    stock_json = json.dumps(stock_data, indent=2)
+    if "error" in stock_data:
+        indicators = {"error": stock_data["error"]}
+    else:
+        # Imported here so pandas and NumPy load on first use, not at worker startup
+        from app.indicators import frame_from_stock_data, summarize_history
+        with timed("indicators"):
+            indicators = summarize_history(frame_from_stock_data(stock_data), interval)
+    indicators_json = json.dumps(indicators, separators=(",", ":"))
 
     system_prompt = "You are a helpful stock analysis assistant."
 
+    # Raw bars make the prompt grow with the range, so they are only sent on request
+    raw_bars = ""
+    if include_raw_bars:
+        raw_bars = f"""
+    Raw OHLCV Bars:
+    {json.dumps(stock_data, separators=(",", ":"))}
+    """
+
     prompt = f"""
-    You are a financial analyst. Analyze the following stock data and provide a summary:
+    You are a financial analyst. Analyze the following stock indicators and provide a summary:
     - Key price trends
     - Notable fluctuations or anomalies
     - Possible reasons behind changes
 
-    Stock Data:
-    {stock_json}
-
+    Indicator Summary (returns, volatility, moving-average crossovers, RSI, drawdown, volume spikes, price gaps):
+    {indicators_json}
+    {raw_bars}
     Provide a concise, human-readable analysis.
     """
 
-    try:
-        completion = client.chat.completions.create(
+    def create():
+        completion = get_llm_client().chat.completions.create(
             model="gpt-4o",
             messages=[{"role": "system", "content": system_prompt},
                       {"role": "user", "content": prompt}]
         )
-        logger.info("AI analysis complete")
         return completion.choices[0].message.content
+
+    try:
+        payload = {"kind": "stock_trends", "indicators": indicators,
+                   "raw_bars": stock_data if include_raw_bars else None}
+        content = cached_completion("gpt-4o", system_prompt, payload, create)
+        logger.info("AI analysis complete")
+        return content
     except Exception as e:
-        logger.error(f"Error generating insights: {e}")
+        logger.error("Error generating insights: %s", e)
         return f"Error generating insights: {str(e)}"
 
 
+def _article_key(article: Dict[str, Any]) -> str:
+    """Content hash of a compacted article, so copies listed under several tickers are scored once."""
+    text = f"{' '.join(article['headline'].lower().split())}|{(article['publisher'] or '').lower()}"
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _valuation_key(symbol: str, keys: List[str]) -> tuple:
+    """Valuations are judged from a symbol's whole article set, so they are cached per set."""
+    return symbol, hashlib.sha1("|".join(sorted(keys)).encode()).hexdigest()[:16]
+
+
+def _sentiment_label(score: float) -> str:
+    if score >= SENTIMENT_THRESHOLD:
+        return "bullish"
+    if score <= -SENTIMENT_THRESHOLD:
+        return "bearish"
+    return "neutral"
+
+
+def _price_movement(score: float) -> str:
+    return {"bullish": "up", "bearish": "down"}.get(_sentiment_label(score), "neutral")
+
+
+def _score_articles(pending: List[tuple], valuation: Dict[str, List[str]],
+                    articles: Dict[str, Dict[str, Any]]) -> tuple:
+    """
+    Score (article key, article, symbols) entries and judge the valuation of each symbol in `valuation`
+    (symbol -> its article keys) in one JSON completion.
+    Returns ({(key, symbol): score}, {symbol: valuation}).
+    """
+    system_prompt = (
+        "You're a financial news sentiment analyzer. For each article, rate its sentiment toward each "
+        "of its listed symbols from -1 (very bearish) to 1 (very bullish), using 0 for neutral. "
+        "For each symbol under \"valuation\", judge from its listed articles whether it is 'overvalued', "
+        "'undervalued' or 'fairly valued'. "
+        'Respond in JSON only, as {"scores": {"<article id>": {"<symbol>": <score>}}, '
+        '"valuation": {"<symbol>": "<verdict>"}}. No explanations.'
+    )
+    ids = {key: str(i) for i, key in enumerate(dict.fromkeys(
+        [key for key, _, _ in pending] + [key for keys in valuation.values() for key in keys]))}
+    to_score = {key: symbols for key, _, symbols in pending}
+    request = {
+        "articles": [{"id": ids[key], "symbols": to_score.get(key, []), **articles[key]} for key in ids],
+        "valuation": {symbol: [ids[key] for key in keys] for symbol, keys in valuation.items()},
+    }
+    completion = get_llm_client().chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": json.dumps(request, separators=(",", ":"))}
+        ],
+        response_format={"type": "json_object"}
+    )
+    returned = json.loads(completion.choices[0].message.content)
+
+    scores = {}
+    for key, symbols in to_score.items():
+        for symbol, score in (returned.get("scores", {}).get(ids[key]) or {}).items():
+            if symbol in symbols and isinstance(score, (int, float)):
+                scores[(key, symbol)] = max(-1.0, min(1.0, float(score)))
+    verdicts = {symbol: verdict for symbol, verdict in (returned.get("valuation") or {}).items()
+                if symbol in valuation and verdict in VALUATIONS}
+    return scores, verdicts
+
+
+@timed("analyze_sentiment")
+def analyze_sentiment_batch(news_by_symbol: Dict[str, Dict]) -> Dict[str, Dict[str, Any]]:
+    """
+    Score recent news sentiment for several symbols with at most one completion.
+    Articles are de-duplicated across symbols by content hash and cut down to headline,
+    publisher and time. Per-(article, symbol) scores and per-symbol valuations are cached,
+    so only unseen pairs and article sets reach the model; the per-symbol verdict is aggregated locally.
+    Each symbol keeps the original sentiment, price_movement and valuation keys alongside
+    score, articles and top_headlines.
+    """
+    articles: Dict[str, Dict[str, Any]] = {}
+    symbols_by_article: Dict[str, List[str]] = {}
+    keys_by_symbol: Dict[str, List[str]] = {symbol: [] for symbol in news_by_symbol}
+    for symbol, news_data in news_by_symbol.items():
+        for item in news_data.get("news", [])[:SENTIMENT_ARTICLES_PER_SYMBOL]:
+            article = compact_article(item)
+            if not article["headline"]:
+                continue
+            key = _article_key(article)
+            articles.setdefault(key, article)
+            linked = symbols_by_article.setdefault(key, [])
+            if symbol not in linked:
+                linked.append(symbol)
+                keys_by_symbol[symbol].append(key)
+
+    scores: Dict[tuple, float] = {}
+    pending = []
+    for key, symbols in symbols_by_article.items():
+        unscored = []
+        for symbol in symbols:
+            score = _article_scores.get((key, symbol))
+            if score is None:
+                unscored.append(symbol)
+            else:
+                scores[(key, symbol)] = score
+        if unscored:
+            pending.append((key, articles[key], unscored))
+
+    valuations: Dict[str, str] = {}
+    to_value: Dict[str, List[str]] = {}
+    for symbol, keys in keys_by_symbol.items():
+        if not keys:
+            continue
+        verdict = _valuations.get(_valuation_key(symbol, keys))
+        if verdict is None:
+            to_value[symbol] = keys
+        else:
+            valuations[symbol] = verdict
+
+    failed: Dict[str, str] = {}
+    if pending or to_value:
+        logger.info("Scoring %s new articles and %s valuations for %s symbols (%s unique of %s listed)",
+                    len(pending), len(to_value), len(news_by_symbol), len(articles),
+                    sum(len(s) for s in symbols_by_article.values()))
+        try:
+            fresh, verdicts = _score_articles(pending, to_value, articles)
+        except Exception as e:
+            logger.error("Batched sentiment analysis failed: %s", e)
+            fresh, verdicts = {}, {}
+            failed = {symbol: str(e) for _, _, symbols in pending for symbol in symbols}
+            failed.update((symbol, str(e)) for symbol in to_value)
+        for pair, score in fresh.items():
+            _article_scores.set(pair, score)
+        for symbol, verdict in verdicts.items():
+            _valuations.set(_valuation_key(symbol, to_value[symbol]), verdict)
+        scores.update(fresh)
+        valuations.update(verdicts)
+
+    results = {}
+    for symbol in news_by_symbol:
+        if symbol in failed:
+            results[symbol] = {"error": failed[symbol]}
+            continue
+        scored = sorted(((scores[(key, symbol)], articles[key]) for key in keys_by_symbol[symbol]
+                         if (key, symbol) in scores), key=lambda s: -abs(s[0]))
+        mean = sum(score for score, _ in scored) / len(scored) if scored else 0.0
+        results[symbol] = {
+            "sentiment": _sentiment_label(mean),
+            "price_movement": _price_movement(mean),
+            "valuation": valuations.get(symbol),
+            "score": round(mean, 3),
+            "articles": len(scored),
+            "top_headlines": [{**article, "score": score} for score, article in scored[:3]],
+        }
+    return results
+
+
 def analyze_sentiment(news_data: Dict) -> Dict[str, Any]:
-    """Condensed sentiment analysis based on recent news."""
-    logger.info(f"Analyzing simplified sentiment for {news_data['symbol']}")
+    """News sentiment for a single fetch_stock_news result."""
+    logger.info("Analyzing news sentiment for %s", news_data['symbol'])
+    return analyze_sentiment_batch({news_data['symbol']: news_data})[news_data['symbol']]
+
+
+def _run_tool(function_name: str, parameters: Dict, data_format: str = "records") -> Optional[Dict[str, Any]]:
+    """
+    Execute a single tool call. Blocking, so it is meant to run in a worker thread.
+    Returns the symbol, the values to merge into tool_outputs and the message content for the model.
+    """
+    if function_name == "resolve_ticker":
+        symbol = resolve_ticker(parameters["company_name"])
+        return {"symbol": symbol, "outputs": {}, "content": {"symbol": symbol}}
+
+    if function_name == "fetch_stock_data":
+        symbol = parameters["symbol"]
+        stock_data = fetch_stock_data(symbol, parameters.get("start_date"), parameters.get("end_date"), data_format)
+        ai_insights = analyze_stock_trends(stock_data)
+        return {
+            "symbol": symbol,
+            "outputs": {"stock_data": stock_data, "ai_insights": ai_insights},
+            "content": {"symbol": symbol, "stock_data": stock_data, "ai_insights": ai_insights}
+        }
+
+    if function_name == "fetch_stock_fundamentals":
+        symbol = parameters["symbol"]
+        fundamentals = fetch_stock_fundamentals(symbol)
+        return {
+            "symbol": symbol,
+            "outputs": {"stock_fundamentals": fundamentals},
+            "content": {"symbol": symbol, "stock_fundamentals": fundamentals}
+        }
+
+    if function_name == "fetch_analyst_recommendations":
+        symbol = parameters["symbol"]
+        recommendations = fetch_analyst_recommendations(symbol)
+        return {
+            "symbol": symbol,
+            "outputs": {"recommendations": recommendations},
+            "content": {"symbol": symbol, "recommendations": recommendations}
+        }
+
+    if function_name == "fetch_stock_news":
+        symbol = parameters["symbol"]
+        # We fetch news but don't keep the articles
+        news = fetch_stock_news(symbol, parameters.get("days_back", 7))
+        return _news_result(symbol, analyze_sentiment(news))
+
+    if function_name == "analyze_portfolio":
+        symbols = expand_symbols(parameters["symbols"])[:PORTFOLIO_MAX_SYMBOLS]
+        if not symbols:
+            raise ValueError("No symbols provided.")
+        portfolio = fetch_portfolio_analytics(symbols, parameters.get("start_date"), parameters.get("end_date"),
+                                              max_symbols=PORTFOLIO_TOOL_MAX_SYMBOLS)
+        # Keyed by the group as requested, e.g. "FAANG"
+        label = ",".join(item.strip().upper() for item in parameters["symbols"].split(",") if item.strip())
+        return {
+            "symbol": label,
+            "outputs": {"portfolio": portfolio},
+            "content": {"symbols": label, "portfolio": portfolio}
+        }
+
+    logger.warning("AI requested unknown tool: %s", function_name)
+    return None
+
+
+def _news_result(symbol: str, sentiment: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "symbol": symbol,
+        "outputs": {"news_sentiment": {"analysis": sentiment}},
+        "content": {"symbol": symbol, "analysis": sentiment}  # only send the condensed summary
+    }
+
+
+async def _run_tool_async(index: int, function_name: str, parameters: Dict, data_format: str) -> List[tuple]:
+    async with _tool_semaphore:
+        return [(index, await asyncio.to_thread(_run_tool, function_name, parameters, data_format))]
+
+
+async def _run_news_batch_async(calls: List[tuple]) -> List[tuple]:
+    """Run a turn's fetch_stock_news calls together: news is fetched concurrently and scored in one completion."""
+    async def fetch(parameters):
+        async with _tool_semaphore:
+            return await asyncio.to_thread(fetch_stock_news, parameters["symbol"], parameters.get("days_back", 7))
+
+    news = await asyncio.gather(*(fetch(parameters) for _, parameters in calls))
+    analyses = await asyncio.to_thread(
+        analyze_sentiment_batch, {parameters["symbol"]: data for (_, parameters), data in zip(calls, news)}
+    )
+    return [(index, _news_result(parameters["symbol"], analyses[parameters["symbol"]])) for index, parameters in calls]
+
+
+async def _run_calls(calls: List[tuple], data_format: str,
+                     results: List[Optional[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run one turn's tool calls concurrently, storing each result at its call's index and yielding
+    a tool_finished event as each completes. News calls are coalesced so their sentiment is
+    scored in a single completion.
+    """
+    news_calls = [(i, params) for i, (name, params) in enumerate(calls) if name == "fetch_stock_news"]
+    batch_news = len(news_calls) > 1
+    tasks = [asyncio.create_task(_run_tool_async(i, name, params, data_format))
+             for i, (name, params) in enumerate(calls) if not (batch_news and name == "fetch_stock_news")]
+    if batch_news:
+        tasks.append(asyncio.create_task(_run_news_batch_async(news_calls)))
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "system",
-                "content": (
-                    "You're a financial news sentiment analyzer. Based only on the news items provided, "
-                    "respond in JSON format with:\n"
-                    "- sentiment: 'bullish', 'bearish', or 'neutral'\n"
-                    "- price_movement: 'up', 'down', or 'neutral'\n"
-                    "- valuation: 'overvalued', 'undervalued', or 'fairly valued'\n\n"
-                    "Do NOT include explanations. Only output keys and values in JSON."
-                )
-            }, {
-                "role": "user",
-                "content": f"News for {news_data['symbol']}:\n{json.dumps(news_data['news'][:5], indent=2)}"
-            }],
-            response_format={"type": "json_object"}
-        )
-        return json.loads(completion.choices[0].message.content)
+        for finished in asyncio.as_completed(tasks):
+            for index, result in await finished:
+                results[index] = result
+                if result is not None:
+                    yield {"event": "tool_finished", "data": {
+                        "name": calls[index][0],
+                        "symbol": result["symbol"],
+                        "tool_outputs": result["outputs"]
+                    }}
+    finally:
+        for task in tasks:
+            task.cancel()
 
-    except Exception as e:
-        logger.error(f"Simplified sentiment analysis failed: {e}")
-        return {"error": str(e)}
+
+def _merge_result(tool_outputs: Dict[str, Any], result: Dict[str, Any]) -> None:
+    symbol = result["symbol"]
+    for key, value in result["outputs"].items():
+        tool_outputs.setdefault(key, {})[symbol] = value
+    if symbol not in tool_outputs["symbols"]:
+        tool_outputs["symbols"].append(symbol)
+
+
+async def _stream_completion(**kwargs) -> AsyncIterator[Any]:
+    """Yield chunks of a streaming chat completion, reading the blocking stream from a worker thread."""
+    stream = await asyncio.to_thread(get_llm_client().chat.completions.create, stream=True, **kwargs)
+    chunks = iter(stream)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+@timed("intent_routing")
+def _local_route(query: str) -> Optional[Route]:
+    """The local parse of `query` when it is confident enough to skip model planning, otherwise None."""
+    if not AI_ROUTER_ENABLED:
+        return None
+    route = parse_query(query)
+    if route is None or route.confidence < AI_ROUTER_MIN_CONFIDENCE:
+        QUERY_ROUTES.inc(route="model")
+        if route is not None:
+            logger.info("Query left to the model: confidence %.2f, unexplained %s", route.confidence, route.unexplained)
+        return None
+    QUERY_ROUTES.inc(route="local")
+    return route
+
+
+def _number(value: Any) -> str:
+    if not isinstance(value, (int, float)):
+        return "n/a" if value is None else str(value)
+    for size, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M")):
+        if abs(value) >= size:
+            return f"{value / size:.2f}{suffix}"
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def _routed_summary(tool_outputs: Dict[str, Any]) -> str:
+    """Plain-text answer assembled from routed tool outputs, in place of the model's final turn."""
+    lines = []
+    for symbol, insights in tool_outputs.get("ai_insights", {}).items():
+        lines.append(f"{symbol}: {insights}")
+    for symbol, fundamentals in tool_outputs.get("stock_fundamentals", {}).items():
+        lines.append(f"{symbol} fundamentals: " + ", ".join(f"{k} {_number(v)}" for k, v in fundamentals.items()))
+    for symbol, recommendations in tool_outputs.get("recommendations", {}).items():
+        latest = (recommendations.get("recommendations") or [None])[-1]
+        lines.append(f"{symbol} analyst recommendations: " + (
+            ", ".join(f"{k} {_number(v)}" for k, v in latest.items()) if latest else "none available"))
+    for symbol, news in tool_outputs.get("news_sentiment", {}).items():
+        analysis = news["analysis"]
+        if "error" in analysis:
+            lines.append(f"{symbol} news sentiment unavailable: {analysis['error']}")
+            continue
+        lines.append(f"{symbol} news sentiment is {analysis['sentiment']} "
+                     f"(score {analysis['score']} over {analysis['articles']} articles).")
+        lines.extend(f"  - {headline['headline']} ({headline['publisher']})" for headline in analysis["top_headlines"])
+    for label, portfolio in tool_outputs.get("portfolio", {}).items():
+        period, rankings = portfolio["period"], portfolio["rankings"]
+        line = f"{label} from {period['start']} to {period['end']}: {rankings[0]['symbol']} led with " \
+               f"{rankings[0]['total_return_pct']}%"
+        if len(rankings) > 1:
+            line += f" and {rankings[-1]['symbol']} trailed with {rankings[-1]['total_return_pct']}%"
+        line += f"; an equal-weight basket returned {portfolio['equal_weight']['total_return_pct']}%"
+        if "benchmark" in portfolio:
+            line += f" against {portfolio['benchmark']['total_return_pct']}% for {portfolio['benchmark']['symbol']}"
+        if portfolio.get("correlation", {}).get("mean") is not None:
+            line += f", with a mean pairwise correlation of {portfolio['correlation']['mean']}"
+        lines.append(line + ".")
+    return "\n".join(lines)
 
 
-async def ai_process_query(query: str):
-    logger.info(f"AI processing query: {query}")
+async def _routed_events(route: Route, data_format: str, tool_outputs: Dict[str, Any], budget: TokenBudget,
+                         usage: Dict[str, int]) -> AsyncIterator[Dict[str, Any]]:
+    """Answer a locally routed query: run its tool calls directly and summarize their outputs without a model turn."""
+    logger.info("Routed query locally: %s for %s (confidence %.2f)", route.intents, route.label, route.confidence)
+    calls = route.calls()
+    for function_name, parameters in calls:
+        yield {"event": "tool_started", "data": {"name": function_name, "parameters": parameters}}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+    async for event in _run_calls(calls, data_format, results):
+        yield event
+    for result in results:
+        if result is not None:
+            _merge_result(tool_outputs, result)
+
+    summary = _routed_summary(tool_outputs)
+    yield {"event": "summary_delta", "data": {"content": summary}}
+    tool_outputs["ai_summary"] = summary
+    tool_outputs["route"] = {"intents": route.intents, "confidence": route.confidence}
+    tool_outputs["token_usage"] = budget.report(usage)
+    yield {"event": "result", "data": {k: v for k, v in tool_outputs.items() if v}}
+
+
+async def ai_process_query_events(query: str, data_format: str = TOOL_OUTPUT_FORMAT) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the tool-calling loop for `query`, yielding progress events as they happen:
+    tool_started, tool_finished (with that tool's partial tool_outputs), summary_delta
+    (tokens of the final answer) and finally result, whose data has the same shape
+    ai_process_query returns. `data_format` selects the stock_data shape ("records" or "columnar").
+    The loop is capped at AI_MAX_TURNS turns and AI_MAX_PROMPT_TOKENS prompt tokens; the result
+    carries the request's token_usage. Queries the local intent router parses confidently skip
+    the loop: their tools run directly and the summary is assembled from the outputs.
+    Failures end the stream with an error event.
+    """
+    logger.info("AI processing query: %s", query)
 
     system_prompt = (
         "You are a helpful stock analysis assistant. "
         "Resolve company names to tickers, fetch stock data, fundamentals, sentiment analysis or analyst recommendations based on user input. "
+        "To compare several stocks or a group such as FAANG, call analyze_portfolio once rather than fetching each symbol. "
         "Call only the necessary tool based on the user's request."
     )
 
@@ -171,108 +591,92 @@ async def ai_process_query(query: str):
         "news_sentiment": {},
     }
 
+    budget = TokenBudget(AI_MAX_TURNS, AI_MAX_PROMPT_TOKENS, AI_DIGEST_THRESHOLD_TOKENS)
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    request_tokens_var.set(usage)
+
     try:
+        # Simple lookups are parsed and dispatched locally, skipping the model's planning turns
+        route = _local_route(query)
+        if route is not None:
+            async for event in _routed_events(route, data_format, tool_outputs, budget, usage):
+                yield event
+            return
+
         while True:
-            response = client.chat.completions.create(
+            turn_started = time.perf_counter()
+            AI_TOOL_TURNS.inc()
+            allow_tools = budget.start_turn(messages)
+            if not allow_tools:
+                logger.info("AI token budget reached after %d turns; requesting final answer", budget.turns)
+            content_parts = []
+            streamed_calls: Dict[int, Dict[str, str]] = {}
+            async for chunk in _stream_completion(
                 model="gpt-4o",
                 messages=messages,
                 tools=tools,
-                tool_choice="auto"
-            )
+                tool_choice="auto" if allow_tools else "none",
+                stream_options={"include_usage": True}
+            ):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield {"event": "summary_delta", "data": {"content": delta.content}}
+                # Tool call names and arguments arrive in fragments keyed by call index
+                for call_delta in delta.tool_calls or []:
+                    call = streamed_calls.setdefault(call_delta.index, {"name": "", "arguments": ""})
+                    if call_delta.function and call_delta.function.name:
+                        call["name"] += call_delta.function.name
+                    if call_delta.function and call_delta.function.arguments:
+                        call["arguments"] += call_delta.function.arguments
 
-            response_message = response.choices[0].message
-            tool_calls = response_message.tool_calls
+            STAGE_LATENCY.observe(time.perf_counter() - turn_started, stage="ai_planning")
 
-            if not tool_calls:
-                final_content = response_message.content
+            if not streamed_calls:
+                STAGE_LATENCY.observe(time.perf_counter() - turn_started, stage="ai_tool_turn")
                 logger.info("AI final response constructed")
-                tool_outputs["ai_summary"] = final_content
-                return {k: v for k, v in tool_outputs.items() if v}  # Clean up empty values
-
-            for tool_call in tool_calls:
-                function_name = tool_call.function.name
-                parameters = json.loads(tool_call.function.arguments)
-                logger.info(f"AI chose tool: {function_name} with params: {parameters}")
-
-                if function_name == "resolve_ticker":
-                    symbol = resolve_ticker(parameters["company_name"])
-                    if symbol not in tool_outputs["symbols"]:
-                        tool_outputs["symbols"].append(symbol)
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps({"symbol": symbol})
-                    })
-
-                elif function_name == "fetch_stock_data":
-                    symbol = parameters["symbol"]
-                    start_date = parameters.get("start_date")
-                    end_date = parameters.get("end_date")
-                    stock_data = fetch_stock_data(symbol, start_date, end_date)
-                    ai_insights = analyze_stock_trends(stock_data)
-                    tool_outputs["stock_data"][symbol] = stock_data
-                    tool_outputs.setdefault("ai_insights", {})[symbol] = ai_insights
-                    if symbol not in tool_outputs["symbols"]:
-                        tool_outputs["symbols"].append(symbol)
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps({
-                            "symbol": symbol,
-                            "stock_data": stock_data,
-                            "ai_insights": ai_insights
-                        })
-                    })
-
-                elif function_name == "fetch_stock_fundamentals":
-                    symbol = parameters["symbol"]
-                    fundamentals = fetch_stock_fundamentals(symbol)
-                    tool_outputs["stock_fundamentals"][symbol] = fundamentals
-                    if symbol not in tool_outputs["symbols"]:
-                        tool_outputs["symbols"].append(symbol)
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps({
-                            "symbol": symbol,
-                            "stock_fundamentals": fundamentals
-                        })
-                    })
-
-                elif function_name == "fetch_analyst_recommendations":
-                    symbol = parameters["symbol"]
-                    recommendations = fetch_analyst_recommendations(symbol)
-                    tool_outputs["recommendations"][symbol] = recommendations
-                    if symbol not in tool_outputs["symbols"]:
-                        tool_outputs["symbols"].append(symbol)
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps({
-                            "symbol": symbol,
-                            "recommendations": recommendations
-                        })
-                    })
-
-                elif function_name == "fetch_stock_news":
-                    symbol = parameters["symbol"]
-                    days_back = parameters.get("days_back", 7)
-                    # We fetch news but don't keep the articles
-                    news = fetch_stock_news(symbol, days_back)
-                    sentiment = analyze_sentiment(news)
-                    tool_outputs["news_sentiment"][symbol] = {"analysis": sentiment}
-                    if symbol not in tool_outputs["symbols"]:
-                        tool_outputs["symbols"].append(symbol)
-
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps({
-                            "symbol": symbol,
-                            "analysis": sentiment  # only send the condensed summary
-                        })
-                    })
+                tool_outputs["ai_summary"] = "".join(content_parts)
+                tool_outputs["token_usage"] = budget.report(usage)
+                logger.info("AI token usage: %s", tool_outputs["token_usage"])
+                yield {"event": "result", "data": {k: v for k, v in tool_outputs.items() if v}}  # Clean up empty values
+                return
+
+            calls = []
+            for _, call in sorted(streamed_calls.items()):
+                function_name = call["name"]
+                parameters = json.loads(call["arguments"] or "{}")
+                logger.info("AI chose tool: %s with params: %s", function_name, parameters)
+                calls.append((function_name, parameters))
+                yield {"event": "tool_started", "data": {"name": function_name, "parameters": parameters}}
+
+            results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+            async for event in _run_calls(calls, data_format, results):
+                yield event
+
+            # Merge in call order so messages stay deterministic
+            for (function_name, _), result in zip(calls, results):
+                if result is None:
+                    continue
+                _merge_result(tool_outputs, result)
+                message = {
+                    "role": "function",
+                    "name": function_name,
+                    "content": json.dumps(result["content"])
+                }
+                messages.append(message)
+                budget.add_tool_message(message, result["content"])
+            STAGE_LATENCY.observe(time.perf_counter() - turn_started, stage="ai_tool_turn")
 
     except Exception as e:
-        logger.error(f"AI process failed: {e}")
-        return {"error": str(e)}
+        logger.error("AI process failed: %s", e)
+        yield {"event": "error", "data": {"error": str(e)}}
+
+
+async def ai_process_query(query: str, data_format: str = TOOL_OUTPUT_FORMAT):
+    result = {"error": "AI process ended without a response"}
+    async for event in ai_process_query_events(query, data_format):
+        if event["event"] in ("result", "error"):
+            result = event["data"]
+    return result
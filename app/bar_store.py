@@ -0,0 +1,271 @@
+# bar_store.py
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple
+from zoneinfo import ZoneInfo
+
+from app.config import BAR_STORE_DIR, BAR_STORE_LIVE_TTL, MARKET_TIMEZONE, UPSTREAM_SERVE_STALE
+from app.logger import logger
+from app.metrics import STALE_RESPONSES
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+DateRange = Tuple[date, date]
+
+# Longest run of weekdays an exchange is expected to stay closed for (holidays, emergencies)
+MAX_CLOSED_WEEKDAYS = 4
+
+
+def market_today() -> date:
+    """The current trading date on the exchange, which can differ from the server's local date."""
+    return datetime.now(ZoneInfo(MARKET_TIMEZONE)).date()
+
+
+def _subtract(ranges: List[DateRange], covered: List[DateRange]) -> List[DateRange]:
+    """Remove the covered [start, end) ranges from the requested ones."""
+    for cov_start, cov_end in covered:
+        remaining = []
+        for start, end in ranges:
+            if cov_end <= start or cov_start >= end:
+                remaining.append((start, end))
+                continue
+            if start < cov_start:
+                remaining.append((start, cov_start))
+            if cov_end < end:
+                remaining.append((cov_end, end))
+        ranges = remaining
+    return ranges
+
+
+def _union(ranges: List[DateRange]) -> List[DateRange]:
+    merged: List[DateRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class BarStore:
+    """
+    On-disk OHLCV store with one parquet file per symbol and bar interval.
+    A JSON sidecar records which [start, end) date ranges are already held so only
+    the missing gaps are fetched upstream. Bars for the current trading day are
+    still moving, so they are kept apart and refetched once older than `live_ttl`.
+    Each symbol is flock-ed while it is read or updated, so uvicorn workers on one host
+    can share the directory.
+    """
+
+    def __init__(self, root: str, live_ttl: int):
+        self.root = Path(root)
+        self.live_ttl = live_ttl
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def get_history(self, symbol: str, start_date: str, end_date: str,
+                    fetch: Callable[[str, str], "pd.DataFrame"], interval: str = "1d") -> "pd.DataFrame":
+        """
+        Return `interval` bars for [start_date, end_date), calling `fetch(start, end)` only for missing gaps.
+        If refetching a gap that already holds bars (today's provisional bars) fails, those bars are served.
+        """
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        key = self._key(symbol, interval)
+
+        with self._lock(key):
+            frame, meta = self._load(key)
+            gaps = self._missing(meta, start, end)
+
+            if gaps:
+                logger.info("Bar store miss for %s: fetching %s gap(s) %s", key, len(gaps), gaps)
+                for gap_start, gap_end in gaps:
+                    try:
+                        fetched = fetch(gap_start.isoformat(), gap_end.isoformat())
+                    except Exception as e:
+                        if not UPSTREAM_SERVE_STALE or self._slice(frame, gap_start, gap_end).empty:
+                            raise
+                        STALE_RESPONSES.inc(cache="bar_store")
+                        logger.warning("Serving stale bars for %s %s..%s: %s", key, gap_start, gap_end, e)
+                        continue
+                    frame = self._merge(frame, fetched)
+                    self._mark_fetched(meta, gap_start, gap_end, fetched, frame)
+                self._save(key, frame, meta)
+            else:
+                logger.info("Bar store hit for %s from %s to %s", key, start_date, end_date)
+
+        return self._slice(frame, start, end)
+
+    def missing_ranges(self, symbol: str, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """Date ranges within [start_date, end_date) that are not held locally."""
+        key = self._key(symbol)
+        with self._lock(key):
+            meta = self._load_meta(key)
+        gaps = self._missing(meta, date.fromisoformat(start_date), date.fromisoformat(end_date))
+        return [(gap_start.isoformat(), gap_end.isoformat()) for gap_start, gap_end in gaps]
+
+    def put(self, symbol: str, start_date: str, end_date: str, fetched: "pd.DataFrame") -> None:
+        """Store bars fetched elsewhere (e.g. a batched download) as covering [start_date, end_date)."""
+        key = self._key(symbol)
+        with self._lock(key):
+            frame, meta = self._load(key)
+            frame = self._merge(frame, fetched)
+            self._mark_fetched(meta, date.fromisoformat(start_date), date.fromisoformat(end_date), fetched, frame)
+            self._save(key, frame, meta)
+
+    def read(self, symbol: str, start_date: str, end_date: str) -> "pd.DataFrame":
+        """Return whatever bars are held locally for [start_date, end_date)."""
+        key = self._key(symbol)
+        with self._lock(key):
+            frame, _ = self._load(key)
+        return self._slice(frame, date.fromisoformat(start_date), date.fromisoformat(end_date))
+
+    def _missing(self, meta: Dict, start: date, end: date) -> List[DateRange]:
+        covered = [(date.fromisoformat(s), date.fromisoformat(e)) for s, e in meta["covered"]]
+        live = meta.get("live")
+        if live and live["date"] == market_today().isoformat() \
+                and time.time() - live["fetched_at"] < self.live_ttl:
+            covered.append((date.fromisoformat(live["date"]), date.fromisoformat(live["end"])))
+        return _subtract([(start, end)], covered) if start < end else []
+
+    def _mark_fetched(self, meta: Dict, start: date, end: date, fetched: "pd.DataFrame",
+                      frame: "pd.DataFrame") -> None:
+        """Record [start, end) as held after a fetch for it returned `fetched`; `frame` is every bar now held."""
+        if (fetched is None or fetched.empty) and not self._expected_empty(frame, start, min(end, market_today())):
+            # Most likely a failed symbol, so past days are not marked as held; only the
+            # provisional live part is recorded, and it expires
+            start = max(start, market_today())
+        self._mark_covered(meta, start, end)
+
+    @staticmethod
+    def _expected_empty(frame: "pd.DataFrame", start: date, end: date) -> bool:
+        """Whether an empty fetch of past days [start, end) is a real answer rather than a failure."""
+        import pandas as pd
+        # No weekdays in the range (a weekend), or a short gap the symbol has traded on both sides of (a holiday)
+        weekdays = len(pd.bdate_range(start, end, inclusive="left")) if start < end else 0
+        if not weekdays:
+            return True
+        if weekdays > MAX_CLOSED_WEEKDAYS or frame.empty:
+            return False
+        index = frame.index.tz_localize(None) if frame.index.tz is not None else frame.index
+        return bool((index < pd.Timestamp(start)).any() and (index >= pd.Timestamp(end)).any())
+
+    def _mark_covered(self, meta: Dict, start: date, end: date) -> None:
+        today = market_today()
+        if end > today:
+            # Anything from today onwards is provisional until the session closes
+            meta["live"] = {"date": today.isoformat(), "end": end.isoformat(), "fetched_at": time.time()}
+            end = today
+        if start >= end:
+            return
+        covered = [(date.fromisoformat(s), date.fromisoformat(e)) for s, e in meta["covered"]]
+        meta["covered"] = [[s.isoformat(), e.isoformat()] for s, e in _union(covered + [(start, end)])]
+
+    @staticmethod
+    def _merge(frame: "pd.DataFrame", fetched: "pd.DataFrame") -> "pd.DataFrame":
+        if fetched is None or fetched.empty:
+            return frame
+        fetched = fetched[BAR_COLUMNS]
+        if frame.empty:
+            return fetched.sort_index()
+        if fetched.index.tz != frame.index.tz:
+            # Batched downloads can return naive dates where history() is exchange-localized
+            if frame.index.tz is None:
+                fetched = fetched.tz_localize(None)
+            elif fetched.index.tz is None:
+                fetched = fetched.tz_localize(frame.index.tz)
+            else:
+                fetched = fetched.tz_convert(frame.index.tz)
+        import pandas as pd
+        merged = pd.concat([frame, fetched])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    @staticmethod
+    def _slice(frame: "pd.DataFrame", start: date, end: date) -> "pd.DataFrame":
+        if frame.empty:
+            return frame
+        import pandas as pd
+        index = frame.index.tz_localize(None) if frame.index.tz is not None else frame.index
+        mask = (index >= pd.Timestamp(start)) & (index < pd.Timestamp(end))
+        return frame[mask]
+
+    def _load(self, key: str) -> Tuple["pd.DataFrame", Dict]:
+        import pandas as pd
+        bars_path, _ = self._paths(key)
+        meta = self._load_meta(key)
+        if not meta["covered"] and "live" not in meta:
+            return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([])), meta
+        try:
+            return pd.read_parquet(bars_path), meta
+        except Exception as e:
+            logger.warning("Discarding unreadable bar store entry for %s: %s", key, e)
+            return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([])), {"covered": []}
+
+    def _load_meta(self, key: str) -> Dict:
+        bars_path, meta_path = self._paths(key)
+        if not bars_path.exists() or not meta_path.exists():
+            return {"covered": []}
+        try:
+            return json.loads(meta_path.read_text())
+        except Exception as e:
+            logger.warning("Discarding unreadable bar store ranges for %s: %s", key, e)
+            return {"covered": []}
+
+    def _save(self, key: str, frame: "pd.DataFrame", meta: Dict) -> None:
+        bars_path, meta_path = self._paths(key)
+        self.root.mkdir(parents=True, exist_ok=True)
+        try:
+            # Write to temp files and rename so readers never see a partial file
+            tmp_bars = bars_path.with_suffix(".parquet.tmp")
+            frame.to_parquet(tmp_bars)
+            os.replace(tmp_bars, bars_path)
+            tmp_meta = meta_path.with_suffix(".json.tmp")
+            tmp_meta.write_text(json.dumps(meta))
+            os.replace(tmp_meta, meta_path)
+        except Exception as e:
+            logger.warning("Could not persist bar store entry for %s: %s", key, e)
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.root / f"{key}.parquet", self.root / f"{key}.ranges.json"
+
+    @staticmethod
+    def _key(symbol: str, interval: str = "1d") -> str:
+        key = re.sub(r"[^A-Z0-9.^_-]", "_", symbol.strip().upper())
+        # Daily bars keep the bare symbol so existing stores stay valid
+        return key if interval == "1d" else f"{key}@{interval}"
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        """
+        Hold `key` exclusively across threads and across every worker process on the host, so
+        load, fetch, merge and save run as one unit and the bars and ranges files always agree.
+        """
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault(key, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / f"{key}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+bar_store = BarStore(BAR_STORE_DIR, BAR_STORE_LIVE_TTL)
@@ -0,0 +1,191 @@
+# cache.py
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from app.config import UPSTREAM_SERVE_STALE
+from app.logger import logger
+from app.metrics import STALE_RESPONSES
+from app.shared_cache import shared_cache
+
+_MISSING = object()
+
+# Named caches created by @cached, reported by cache_stats()
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with LRU eviction, per-entry expiry and hit/miss counters.
+    Expired entries stay until they are replaced or evicted, so get_stale can still serve them.
+    With a `shared` namespace, misses fall through to the host-wide shared cache and sets
+    are written to it too, so every worker sees entries loaded by any of them.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, shared: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Nothing worth sharing when entries never live
+        self.shared = shared if shared_cache is not None and ttl > 0 else None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def _get_local(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                return entry[0]
+            return _MISSING
+
+    def _set_local(self, key: Hashable, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._get_local(key)
+        if value is _MISSING and self.shared is not None:
+            found = shared_cache.get(self.shared, key)
+            if found is not None:
+                value, remaining = found
+                self._set_local(key, value, time.monotonic() + remaining)
+                with self._lock:
+                    self.shared_hits += 1
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.shared is not None:
+            shared_cache.record(self.shared, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Return the entry for `key` even if it has expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            return entry[0]
+        if self.shared is not None:
+            return shared_cache.get_stale(self.shared, key, default)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._set_local(key, value, time.monotonic() + ttl)
+        if self.shared is not None and ttl > 0:
+            shared_cache.set(self.shared, key, value, ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+        if self.shared is not None:
+            shared_cache.clear(self.shared)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+            if self.shared is not None:
+                # Included in hits: found in the shared cache after an in-process miss
+                stats["shared_hits"] = self.shared_hits
+            return stats
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution whose outcome every caller shares."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def named_cache(name: str, maxsize: int, ttl: float) -> TTLCache:
+    """Create a TTLCache that is reported by cache_stats() under `name` and shared across workers under the same name."""
+    cache = _registry[name] = TTLCache(maxsize, ttl, shared=name)
+    return cache
+
+
+def cached(name: str, ttl: float, maxsize: int = 1024):
+    """
+    Memoize a blocking function for `ttl` seconds, keyed on its arguments.
+    Concurrent misses for the same arguments share a single upstream call; exceptions are not cached.
+    When the call fails and UPSTREAM_SERVE_STALE is set, an expired entry is returned instead.
+    """
+    def decorator(func):
+        cache = named_cache(name, maxsize, ttl)
+        flight = SingleFlight()
+
+        def load(key, args, kwargs, entry_ttl=None):
+            value = func(*args, **kwargs)
+            cache.set(key, value, ttl=entry_ttl)
+            return value
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            try:
+                return flight.do(key, lambda: load(key, args, kwargs))
+            except Exception as e:
+                stale = cache.get_stale(key, _MISSING) if UPSTREAM_SERVE_STALE else _MISSING
+                if stale is _MISSING:
+                    raise
+                STALE_RESPONSES.inc(cache=name)
+                logger.warning("Serving stale %s entry after upstream failure: %s", name, e)
+                return stale
+
+        def refresh(args: tuple = (), kwargs: Optional[dict] = None, ttl: Optional[float] = None) -> Any:
+            """Reload an entry ahead of expiry, optionally keeping it for `ttl` seconds instead of the default."""
+            kwargs = kwargs or {}
+            key = (args, tuple(sorted(kwargs.items())))
+            return flight.do(key, lambda: load(key, args, kwargs, ttl))
+
+        wrapper.cache = cache
+        wrapper.refresh = refresh
+        return wrapper
+
+    return decorator
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -3,4 +3,135 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-OPEN_API_KEY = os.getenv("OPEN_API_KEY")
\ No newline at end of file
+OPEN_API_KEY = os.getenv("OPEN_API_KEY")
+
+# Local OHLCV bar store
+BAR_STORE_ENABLED = os.getenv("BAR_STORE_ENABLED", "true").lower() == "true"
+BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", "data/bars")
+# Seconds before the bars for the current trading day are refetched
+BAR_STORE_LIVE_TTL = int(os.getenv("BAR_STORE_LIVE_TTL", "300"))
+
+# Maximum number of tool calls from one model turn executed at the same time
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "5"))
+# Default stock_data shape in tool outputs: "records" or "columnar"
+TOOL_OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", "records")
+# Model turns allowed per ai_process_query call; the last one must answer without tools
+AI_MAX_TURNS = int(os.getenv("AI_MAX_TURNS", "6"))
+# Estimated prompt size above which the model is asked to answer with what it already has
+AI_MAX_PROMPT_TOKENS = int(os.getenv("AI_MAX_PROMPT_TOKENS", "60000"))
+# Consumed tool results larger than this (estimated tokens) are replaced with digests
+AI_DIGEST_THRESHOLD_TOKENS = int(os.getenv("AI_DIGEST_THRESHOLD_TOKENS", "400"))
+
+# Local intent router: queries parsed with at least this confidence (share of words understood)
+# run their tools directly instead of going through the model's planning turns
+AI_ROUTER_ENABLED = os.getenv("AI_ROUTER_ENABLED", "true").lower() == "true"
+AI_ROUTER_MIN_CONFIDENCE = float(os.getenv("AI_ROUTER_MIN_CONFIDENCE", "0.85"))
+
+# LLM completion cache
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "900"))
+LLM_CACHE_MAXSIZE = int(os.getenv("LLM_CACHE_MAXSIZE", "1024"))
+# Optional on-disk tier; leave unset to keep the cache in memory only
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+
+# Batched news sentiment: articles scored per symbol, and how long per-article scores are reused
+SENTIMENT_ARTICLES_PER_SYMBOL = int(os.getenv("SENTIMENT_ARTICLES_PER_SYMBOL", "5"))
+SENTIMENT_SCORE_TTL = int(os.getenv("SENTIMENT_SCORE_TTL", "86400"))
+SENTIMENT_SCORE_MAXSIZE = int(os.getenv("SENTIMENT_SCORE_MAXSIZE", "4096"))
+
+# Seconds that upstream snapshots stay cached per data type
+FUNDAMENTALS_CACHE_TTL = int(os.getenv("FUNDAMENTALS_CACHE_TTL", "21600"))
+RECOMMENDATIONS_CACHE_TTL = int(os.getenv("RECOMMENDATIONS_CACHE_TTL", "3600"))
+NEWS_CACHE_TTL = int(os.getenv("NEWS_CACHE_TTL", "300"))
+
+# Portfolio analytics: index that betas and relative returns are measured against,
+# range used when no dates are given, and the rolling volatility window in bars
+PORTFOLIO_BENCHMARK = os.getenv("PORTFOLIO_BENCHMARK", "SPY")
+PORTFOLIO_LOOKBACK_DAYS = int(os.getenv("PORTFOLIO_LOOKBACK_DAYS", "365"))
+PORTFOLIO_VOLATILITY_WINDOW = int(os.getenv("PORTFOLIO_VOLATILITY_WINDOW", "20"))
+# Most symbols accepted in one portfolio request
+PORTFOLIO_MAX_SYMBOLS = int(os.getenv("PORTFOLIO_MAX_SYMBOLS", "500"))
+# Ranking rows (leaders plus laggards) sent to the model by the analyze_portfolio tool
+PORTFOLIO_TOOL_MAX_SYMBOLS = int(os.getenv("PORTFOLIO_TOOL_MAX_SYMBOLS", "20"))
+
+# Host-wide cache tier shared by all workers (SQLite in WAL mode), consulted after each in-process cache
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "data/shared_cache.sqlite3")
+# Size cap for the shared cache file's entries; those expiring soonest are evicted first
+SHARED_CACHE_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))
+
+# Background cache warming for a watchlist of tickers: comma-separated in WATCHLIST
+# and/or one per line in WATCHLIST_FILE. Nothing is scheduled when both are empty.
+WATCHLIST = os.getenv("WATCHLIST", "")
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE")
+# Days of price history kept warm in the bar store for each watched symbol
+WATCHLIST_LOOKBACK_DAYS = int(os.getenv("WATCHLIST_LOOKBACK_DAYS", "365"))
+# Seconds between refreshes of each dataset during market hours
+WATCHLIST_PRICE_INTERVAL = int(os.getenv("WATCHLIST_PRICE_INTERVAL", "240"))
+WATCHLIST_NEWS_INTERVAL = int(os.getenv("WATCHLIST_NEWS_INTERVAL", "240"))
+WATCHLIST_FUNDAMENTALS_INTERVAL = int(os.getenv("WATCHLIST_FUNDAMENTALS_INTERVAL", "3600"))
+# Intervals are multiplied by this outside market hours
+WATCHLIST_OFF_HOURS_FACTOR = float(os.getenv("WATCHLIST_OFF_HOURS_FACTOR", "4"))
+# Also precompute analyze_stock_trends for the default range after each price refresh
+WATCHLIST_WARM_TRENDS = os.getenv("WATCHLIST_WARM_TRENDS", "false").lower() == "true"
+# Symbols refreshed at once during the initial warm-up pass
+WATCHLIST_CONCURRENCY = int(os.getenv("WATCHLIST_CONCURRENCY", "4"))
+# Only the uvicorn worker holding this file lock runs the warmer; empty runs it in every worker
+WATCHLIST_LOCK_PATH = os.getenv("WATCHLIST_LOCK_PATH", "data/watchlist.lock")
+# Regular trading session used to pick the refresh cadence
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+MARKET_OPEN = os.getenv("MARKET_OPEN", "09:30")
+MARKET_CLOSE = os.getenv("MARKET_CLOSE", "16:00")
+
+# Company names resolved through yahooquery are remembered here
+SYMBOL_INDEX_CACHE = os.getenv("SYMBOL_INDEX_CACHE", "data/symbol_index.json")
+# Minimum trigram similarity for a fuzzy local match to skip the remote search
+SYMBOL_MATCH_THRESHOLD = float(os.getenv("SYMBOL_MATCH_THRESHOLD", "0.75"))
+
+# Upstream providers: "live" calls Yahoo/OpenAI, "record" also saves every response
+# to FIXTURES_DIR, "replay" serves those fixtures offline with optional injected latency
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live").lower()
+FIXTURES_DIR = os.getenv("FIXTURES_DIR", "fixtures")
+REPLAY_LATENCY_MS = float(os.getenv("REPLAY_LATENCY_MS", "0"))
+REPLAY_LLM_LATENCY_MS = float(os.getenv("REPLAY_LLM_LATENCY_MS", "0"))
+
+# Upstream call policy: per-provider concurrency and rate limits (calls per second, 0 = unlimited),
+# retries of transient errors with jittered exponential backoff, and a circuit breaker that
+# fails fast after repeated failures
+YFINANCE_CONCURRENCY = int(os.getenv("YFINANCE_CONCURRENCY", "8"))
+YFINANCE_RATE_PER_SEC = float(os.getenv("YFINANCE_RATE_PER_SEC", "5"))
+YAHOOQUERY_CONCURRENCY = int(os.getenv("YAHOOQUERY_CONCURRENCY", "4"))
+YAHOOQUERY_RATE_PER_SEC = float(os.getenv("YAHOOQUERY_RATE_PER_SEC", "2"))
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+OPENAI_RATE_PER_SEC = float(os.getenv("OPENAI_RATE_PER_SEC", "10"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+# Serve expired cache entries and stored bars when the upstream call fails
+UPSTREAM_SERVE_STALE = os.getenv("UPSTREAM_SERVE_STALE", "true").lower() == "true"
+# Fraction of replayed upstream calls that fail with a transient error, for fault-injection runs
+REPLAY_ERROR_RATE = float(os.getenv("REPLAY_ERROR_RATE", "0"))
+
+# Load heavy libraries, build upstream clients and the symbol index in the background at startup,
+# instead of on the first request that needs them
+WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "true").lower() == "true"
+
+# Generate a trace ID for requests that do not send an X-Trace-Id header
+TRACE_IDS_ENABLED = os.getenv("TRACE_IDS_ENABLED", "false").lower() == "true"
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" or "json" (one structured record per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+# Size-based rotation by default; set LOG_ROTATE_WHEN (e.g. "midnight", "H") for time-based rotation.
+# While rotation is on, each process logs to LOG_FILE with its PID added (logs/app.<pid>.log);
+# LOG_MAX_BYTES=0 without LOG_ROTATE_WHEN shares LOG_FILE between workers and leaves rotation to logrotate
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Fraction of INFO/DEBUG records kept; warnings and errors are never sampled
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
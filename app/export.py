@@ -0,0 +1,39 @@
+# export.py
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator
+
+import orjson
+
+from app.services import OHLCV_COLUMNS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def ndjson_chunks(frames: Iterable["pd.DataFrame"]) -> Iterator[bytes]:
+    """
+    One JSON object per bar ({"timestamp": ..., "Open": ..., ...}), encoded a chunk at a time.
+    A failure part-way through ends the stream with an {"error": ...} line.
+    """
+    try:
+        for frame in frames:
+            rows = frame[OHLCV_COLUMNS].to_numpy().tolist()
+            yield b"".join(
+                orjson.dumps({"timestamp": timestamp, **dict(zip(OHLCV_COLUMNS, row))}) + b"\n"
+                for timestamp, row in zip(frame.index.astype(str), rows)
+            )
+    except ValueError as e:
+        yield orjson.dumps({"error": str(e)}) + b"\n"
+
+
+def csv_chunks(frames: Iterable["pd.DataFrame"]) -> Iterator[bytes]:
+    """A header row, then the bars of each chunk as CSV. A failure part-way through aborts the response."""
+    yield ("timestamp," + ",".join(OHLCV_COLUMNS) + "\n").encode()
+    for frame in frames:
+        yield frame[OHLCV_COLUMNS].to_csv(header=False).encode()
+
+
+# format -> (encoder, media type, file extension)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    "ndjson": (ndjson_chunks, "application/x-ndjson", "ndjson"),
+    "csv": (csv_chunks, "text/csv", "csv"),
+}
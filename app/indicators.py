@@ -0,0 +1,170 @@
+# indicators.py
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+# Minutes in a regular US session, to count intraday bars per year
+SESSION_MINUTES = 390
+_INTRADAY_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90, "1h": 60}
+# Approximate bars per year at each interval, for annualizing per-bar volatility
+BARS_PER_YEAR = {
+    **{interval: TRADING_DAYS * SESSION_MINUTES / minutes for interval, minutes in _INTRADAY_MINUTES.items()},
+    "1d": TRADING_DAYS, "5d": TRADING_DAYS / 5, "1wk": 52, "1mo": 12, "3mo": 4,
+}
+SMA_SHORT, SMA_LONG = 20, 50
+EMA_FAST, EMA_SLOW = 12, 26
+RSI_PERIOD = 14
+# Number of notable events (volume spikes, gaps, extreme days) kept in the summary
+TOP_EVENTS = 5
+RECENT_BARS = 5
+
+
+def _round(value, digits: int = 4):
+    if value is None or (isinstance(value, float) and not np.isfinite(value)):
+        return None
+    return round(float(value), digits)
+
+
+def _labels(index: pd.DatetimeIndex) -> List[str]:
+    fmt = "%Y-%m-%d" if (index == index.normalize()).all() else "%Y-%m-%d %H:%M"
+    return list(index.strftime(fmt))
+
+
+def frame_from_stock_data(stock_data: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Rebuild an OHLCV DataFrame from either result shape of fetch_stock_data:
+    records ({timestamp: {field: value}}) or columnar (parallel arrays under "timestamps").
+    """
+    if "timestamps" in stock_data:
+        timestamps = stock_data["timestamps"]
+        frame = pd.DataFrame({k: v for k, v in stock_data.items() if k != "timestamps"}, index=timestamps)
+    else:
+        frame = pd.DataFrame.from_dict(stock_data, orient="index")
+    # Keys are str(Timestamp); drop any UTC offset so bars keep their exchange-local wall time
+    frame.index = pd.to_datetime(pd.Index(frame.index).str[:19])
+    return frame.sort_index()
+
+
+def _rsi(close: pd.Series, period: int) -> float:
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    rsi = 100 - 100 / (1 + gain / loss)
+    return rsi.iloc[-1]
+
+
+def _last_crossover(fast: pd.Series, slow: pd.Series, labels: np.ndarray) -> Dict[str, Any]:
+    sign = np.sign((fast - slow).to_numpy())
+    valid = ~np.isnan(sign)
+    crosses = np.flatnonzero(valid[1:] & valid[:-1] & (sign[1:] != sign[:-1]) & (sign[1:] != 0)) + 1
+    state = "above" if sign[-1] > 0 else "below" if sign[-1] < 0 else "equal"
+    if not len(crosses):
+        return {"state": state, "last_cross": None}
+    last = crosses[-1]
+    return {
+        "state": state,
+        "last_cross": {"date": labels[last], "type": "bullish" if sign[last] > 0 else "bearish"}
+    }
+
+
+def summarize_history(data: pd.DataFrame, interval: str = "1d") -> Dict[str, Any]:
+    """
+    Compute a fixed-size feature summary of an OHLCV history: returns, volatility,
+    SMA/EMA crossovers, RSI, drawdown, volume spikes and price gaps.
+    The output size does not grow with the length of the range. Returns and volatility are
+    per bar of `interval`; annualized volatility is scaled by that interval's bars per year.
+    """
+    data = data.dropna(subset=["Close"])
+    if data.empty:
+        return {"bars": 0}
+
+    labels = np.array(_labels(data.index))
+    open_, high, low = data["Open"].astype(float), data["High"].astype(float), data["Low"].astype(float)
+    close, volume = data["Close"].astype(float), data["Volume"].astype(float)
+    returns = close.pct_change()
+
+    summary: Dict[str, Any] = {
+        "period": {"start": labels[0], "end": labels[-1], "bars": len(data), "interval": interval},
+        "price": {
+            "first_close": _round(close.iloc[0]),
+            "last_close": _round(close.iloc[-1]),
+            "high": {"value": _round(high.max()), "date": labels[int(high.to_numpy().argmax())]},
+            "low": {"value": _round(low.min()), "date": labels[int(low.to_numpy().argmin())]},
+            "total_return_pct": _round((close.iloc[-1] / close.iloc[0] - 1) * 100, 2),
+        },
+        "recent_closes": dict(zip(labels[-RECENT_BARS:], (_round(c) for c in close.iloc[-RECENT_BARS:]))),
+    }
+
+    if len(data) < 2:
+        return summary
+
+    per_bar = returns.to_numpy()[1:]
+    order = np.argsort(per_bar)
+    summary["returns"] = {
+        "mean_per_bar_pct": _round(np.mean(per_bar) * 100, 3),
+        "best_bars": [{"date": labels[i + 1], "pct": _round(per_bar[i] * 100, 2)} for i in order[::-1][:3]],
+        "worst_bars": [{"date": labels[i + 1], "pct": _round(per_bar[i] * 100, 2)} for i in order[:3]],
+        "up_bars": int((per_bar > 0).sum()),
+        "down_bars": int((per_bar < 0).sum()),
+    }
+    bar_vol = np.std(per_bar, ddof=1) if len(per_bar) > 1 else 0.0
+    summary["volatility"] = {
+        "per_bar_pct": _round(bar_vol * 100, 3),
+        "annualized_pct": _round(bar_vol * np.sqrt(BARS_PER_YEAR[interval]) * 100, 2),
+        "avg_true_range_pct": _round(((high - low) / close).mean() * 100, 3),
+    }
+
+    running_peak = close.cummax()
+    drawdown = (close / running_peak - 1).to_numpy()
+    trough = int(drawdown.argmin())
+    peak = int(close.iloc[:trough + 1].to_numpy().argmax())
+    summary["drawdown"] = {
+        "max_pct": _round(drawdown[trough] * 100, 2),
+        "peak_date": labels[peak],
+        "trough_date": labels[trough],
+        "current_pct": _round(drawdown[-1] * 100, 2),
+    }
+
+    trend: Dict[str, Any] = {}
+    if len(data) >= SMA_SHORT:
+        sma_short = close.rolling(SMA_SHORT).mean()
+        trend[f"sma{SMA_SHORT}"] = _round(sma_short.iloc[-1])
+        trend[f"price_vs_sma{SMA_SHORT}"] = _last_crossover(close, sma_short, labels)
+        if len(data) >= SMA_LONG:
+            sma_long = close.rolling(SMA_LONG).mean()
+            trend[f"sma{SMA_LONG}"] = _round(sma_long.iloc[-1])
+            trend[f"sma{SMA_SHORT}_vs_sma{SMA_LONG}"] = _last_crossover(sma_short, sma_long, labels)
+    if len(data) >= EMA_SLOW:
+        ema_fast = close.ewm(span=EMA_FAST, adjust=False).mean()
+        ema_slow = close.ewm(span=EMA_SLOW, adjust=False).mean()
+        trend["macd"] = _round(ema_fast.iloc[-1] - ema_slow.iloc[-1])
+        trend[f"ema{EMA_FAST}_vs_ema{EMA_SLOW}"] = _last_crossover(ema_fast, ema_slow, labels)
+    if len(data) > RSI_PERIOD:
+        trend[f"rsi{RSI_PERIOD}"] = _round(_rsi(close, RSI_PERIOD), 2)
+    if trend:
+        summary["trend"] = trend
+
+    avg_volume = volume.rolling(SMA_SHORT, min_periods=1).mean().shift(1)
+    volume_ratio = (volume / avg_volume).to_numpy()
+    spikes = np.flatnonzero(volume_ratio >= 2)
+    spikes = spikes[np.argsort(volume_ratio[spikes])[::-1][:TOP_EVENTS]]
+    summary["volume"] = {
+        "avg": _round(volume.mean(), 0),
+        "last_vs_avg": _round(volume_ratio[-1], 2),
+        "spikes": [
+            {"date": labels[i], "x_avg": _round(volume_ratio[i], 2), "return_pct": _round(returns.iloc[i] * 100, 2)}
+            for i in sorted(spikes)
+        ],
+    }
+
+    gap_pct = (open_ / close.shift(1) - 1).to_numpy()
+    gaps = np.flatnonzero(np.abs(np.nan_to_num(gap_pct)) >= 0.02)
+    gaps = gaps[np.argsort(np.abs(gap_pct[gaps]))[::-1][:TOP_EVENTS]]
+    summary["gaps"] = [
+        {"date": labels[i], "direction": "up" if gap_pct[i] > 0 else "down", "pct": _round(gap_pct[i] * 100, 2)}
+        for i in sorted(gaps)
+    ]
+
+    return summary
@@ -0,0 +1,211 @@
+# intent_router.py
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.symbol_index import symbol_index
+from app.utils import ACRONYM_GROUPS
+
+# Checked in order, each removing its matches before the next runs, so "price target" is read
+# as an analyst question rather than a price one
+INTENT_PATTERNS = [
+    ("fetch_analyst_recommendations",
+     r"analysts?|recommendations?|ratings?|upgrades?|downgrades?|price targets?|consensus"),
+    ("fetch_stock_fundamentals",
+     r"fundamentals?|market cap(italization)?s?|p/?e( ratio)?s?|valuations?|dividends?( yields?)?|eps|"
+     r"earnings per share|52[- ]week (highs?|lows?|range)"),
+    ("fetch_stock_news", r"news|headlines?|sentiment"),
+    ("analyze_portfolio",
+     r"compare[sd]?|comparison|versus|vs\.?|correlat\w*|betas?|relative strength|outperform\w*|underperform\w*|"
+     r"rank\w*"),
+    ("fetch_stock_data",
+     r"prices?|stock data|charts?|perform\w*|history|historical|trends?|trading|traded|quotes?|clos(e|es|ed|ing)|"
+     r"returns?|analy[sz]e|analysis|moves?|moved|ohlcv?|volume"),
+]
+_INTENTS = [(name, re.compile(rf"\b(?:{pattern})(?=\W|$)", re.I)) for name, pattern in INTENT_PATTERNS]
+
+# Questions that ask for the model's judgement rather than a data lookup always go to the full loop
+_JUDGEMENT = re.compile(
+    r"\b(why|should|would|could|explain\w*|predict\w*|forecast\w*|worth|buy|sell|invest\w*|opinion|think|"
+    r"outlook|expect\w*|risk\w*|if|better|cheap|expensive|undervalued|overvalued)\b", re.I
+)
+
+# Words that carry no meaning for routing
+_FILLER = set("""
+a an the of for in on at to from by with and or me my i we you us show get give fetch pull find tell list see
+what whats what's is are was were be how has have had did do does done it its their them this that these those
+stock stocks share shares ticker tickers symbol symbols company companies data info information details
+please can about over during latest recent current currently now all each both up lookup look check
+daily weekly monthly
+""".split())
+
+# Uppercase words in a question that are far more likely abbreviations than tickers
+_NOT_TICKERS = {"I", "A", "AI", "CEO", "CFO", "EPS", "ETF", "IPO", "PE", "US", "USA", "USD", "YTD", "OHLC", "OHLCV"}
+_TICKER = re.compile(r"\$?\b[A-Z]{1,5}(?:[.-][A-Z]{1,2})?\b")
+_GROUP = re.compile(r"\b(" + "|".join(ACRONYM_GROUPS) + r")\b", re.I)
+_WORD = re.compile(r"[A-Za-z][A-Za-z'&.]*[A-Za-z]|[A-Za-z]")
+
+_UNIT_DAYS = {"day": 1, "week": 7, "month": 30, "year": 365}
+_NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+            "ten": 10, "twelve": 12}
+_ISO = r"(\d{4}-\d{2}-\d{2})"
+
+# Group questions about prices go to analyze_portfolio from this many symbols on
+PORTFOLIO_MIN_SYMBOLS = 3
+
+
+def _date_rules(today: date) -> List[Tuple[re.Pattern, Callable[[re.Match], Tuple[Optional[date], Optional[date]]]]]:
+    """(pattern, match -> (start, end)) pairs. Ends are exclusive, so "last week" includes today."""
+    tomorrow = today + timedelta(days=1)
+
+    def last(match):
+        count = match.group(1)
+        count = int(count) if count and count.isdigit() else _NUMBERS.get((count or "").lower(), 1)
+        return today - timedelta(days=count * _UNIT_DAYS[match.group(2).lower()]), tomorrow
+
+    def year(match):
+        value = int(match.group(1))
+        return date(value, 1, 1), min(date(value + 1, 1, 1), tomorrow)
+
+    return [
+        (re.compile(rf"\b(?:from|between)?\s*{_ISO}\s*(?:to|until|through|and|-)\s*{_ISO}"),
+         lambda m: (date.fromisoformat(m.group(1)), date.fromisoformat(m.group(2)))),
+        (re.compile(rf"\b(?:since|from|after)\s+{_ISO}"), lambda m: (date.fromisoformat(m.group(1)), tomorrow)),
+        (re.compile(r"\b(?:in\s+the\s+|over\s+the\s+|for\s+the\s+)?(?:last|past|previous)\s+(\d+|"
+                    + "|".join(_NUMBERS) + r")?\s*(day|week|month|year)s?\b", re.I), last),
+        (re.compile(r"\b(?:ytd|year[- ]to[- ]date|this year)\b", re.I), lambda m: (date(today.year, 1, 1), tomorrow)),
+        (re.compile(r"\bthis month\b", re.I), lambda m: (today.replace(day=1), tomorrow)),
+        (re.compile(r"\bthis week\b", re.I), lambda m: (today - timedelta(days=today.weekday()), tomorrow)),
+        (re.compile(r"\byesterday\b", re.I), lambda m: (today - timedelta(days=1), today)),
+        (re.compile(r"\b(?:in|during|for)\s+((?:19|20)\d{2})\b", re.I), year),
+        (re.compile(rf"\b(?:on\s+)?{_ISO}"),
+         lambda m: (date.fromisoformat(m.group(1)), date.fromisoformat(m.group(1)) + timedelta(days=1))),
+        # The services' default range already covers the latest session
+        (re.compile(r"\btoday\b", re.I), lambda m: (None, None)),
+    ]
+
+
+@dataclass
+class Route:
+    """A query parsed into tool calls, with the share of its words the parse explained."""
+    symbols: List[str]
+    # Symbols and groups as mentioned, e.g. "FAANG,MSFT"
+    label: str
+    intents: List[str]
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    confidence: float = 1.0
+    unexplained: List[str] = field(default_factory=list)
+
+    def calls(self) -> List[Tuple[str, Dict[str, Any]]]:
+        dates = {key: value for key, value in (("start_date", self.start_date), ("end_date", self.end_date)) if value}
+        calls = []
+        for intent in self.intents:
+            if intent == "analyze_portfolio":
+                calls.append((intent, {"symbols": self.label, **dates}))
+            elif intent == "fetch_stock_data":
+                calls.extend((intent, {"symbol": symbol, **dates}) for symbol in self.symbols)
+            else:
+                calls.extend((intent, {"symbol": symbol}) for symbol in self.symbols)
+        return calls
+
+
+def _consume(text: str, spans: List[Tuple[int, int]], pattern: re.Pattern) -> List[re.Match]:
+    """Matches of `pattern` that do not overlap text already explained, recording their spans."""
+    found = []
+    for match in pattern.finditer(text):
+        if any(start < match.end() and match.start() < end for start, end in spans):
+            continue
+        spans.append(match.span())
+        found.append(match)
+    return found
+
+
+def parse_query(query: str, today: Optional[date] = None) -> Optional[Route]:
+    """
+    Parse ticker, acronym-group and company-name mentions, a date phrase and intents from `query`.
+    Returns None when the query names no symbol, has an impossible date or needs the model's
+    judgement. Otherwise returns a Route whose confidence is the share of non-filler words the parse
+    explained. Any capitalized word left unexplained may be a company the index does not know, so
+    it forces a confidence of 0.
+    """
+    if _JUDGEMENT.search(query):
+        return None
+    today = today or date.today()
+    spans: List[Tuple[int, int]] = []
+
+    start = end = None
+    for pattern, resolve in _date_rules(today):
+        for match in _consume(query, spans, pattern):
+            try:
+                start, end = resolve(match)
+            except ValueError:
+                # Not a real calendar date; leave it to the model
+                return None
+        if start is not None:
+            break
+
+    intents = []
+    for name, pattern in _INTENTS:
+        if _consume(query, spans, pattern):
+            intents.append(name)
+
+    mentions: List[Tuple[int, str, List[str]]] = []
+    for match in _consume(query, spans, _GROUP):
+        group = match.group(1).upper()
+        mentions.append((match.start(), group, ACRONYM_GROUPS[group]))
+    for match in _TICKER.finditer(query):
+        token = match.group(0)
+        explicit = token.startswith("$")
+        symbol = token.lstrip("$")
+        if not explicit and (symbol in _NOT_TICKERS or not symbol_index.is_symbol(symbol)):
+            continue
+        if not any(s < match.end() and match.start() < e for s, e in spans):
+            spans.append(match.span())
+            mentions.append((match.start(), symbol, [symbol]))
+
+    # Company names and aliases, longest phrases first, from the words nothing else explained
+    words = [m for m in _WORD.finditer(query) if not any(s < m.end() and m.start() < e for s, e in spans)]
+    for size in (3, 2, 1):
+        for i in range(len(words) - size + 1):
+            window = words[i:i + size]
+            if any(any(s < w.end() and w.start() < e for s, e in spans) for w in window):
+                continue
+            if all(w.group(0).lower() in _FILLER for w in window):
+                continue
+            if any(query[a.end():b.start()].strip() not in ("", "-") for a, b in zip(window, window[1:])):
+                continue
+            symbol = symbol_index.lookup_name(query[window[0].start():window[-1].end()])
+            if symbol:
+                spans.append((window[0].start(), window[-1].end()))
+                mentions.append((window[0].start(), symbol, [symbol]))
+
+    if not mentions:
+        return None
+    mentions.sort()
+    symbols = list(dict.fromkeys(symbol for _, _, group in mentions for symbol in group))
+    label = ",".join(dict.fromkeys(name for _, name, _ in mentions))
+
+    remaining = [m.group(0) for m in _WORD.finditer(query) if not any(s <= m.start() < e for s, e in spans)]
+    unexplained = [word for word in remaining if word.lower() not in _FILLER]
+    content = len(unexplained) + sum(1 for m in _WORD.finditer(query)
+                                     if any(s <= m.start() < e for s, e in spans))
+    confidence = 1 - len(unexplained) / max(content, 1)
+    if any(word[0].isupper() for word in unexplained):
+        confidence = 0.0
+
+    if not intents:
+        # A bare mention such as "AAPL" or "Tesla stock" asks for its recent prices
+        intents = ["fetch_stock_data"]
+    grouped = any(len(group) > 1 for _, _, group in mentions) or len(symbols) >= PORTFOLIO_MIN_SYMBOLS
+    if "fetch_stock_data" in intents and (grouped or "analyze_portfolio" in intents):
+        intents.remove("fetch_stock_data")
+        if "analyze_portfolio" not in intents:
+            intents.append("analyze_portfolio")
+
+    return Route(
+        symbols=symbols, label=label, intents=intents,
+        start_date=start.isoformat() if start else None, end_date=end.isoformat() if end else None,
+        confidence=round(confidence, 3), unexplained=unexplained,
+    )
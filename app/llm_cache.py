@@ -0,0 +1,114 @@
+# llm_cache.py
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.cache import TTLCache
+from app.config import LLM_CACHE_DIR, LLM_CACHE_ENABLED, LLM_CACHE_MAXSIZE, LLM_CACHE_TTL, UPSTREAM_SERVE_STALE
+from app.logger import logger
+from app.metrics import STALE_RESPONSES
+
+
+class CompletionCache:
+    """
+    Content-addressed cache for chat completions.
+    Entries live in an in-memory LRU/TTL tier backed by the host-wide shared cache and,
+    when `disk_dir` is set, in a JSON-file tier that survives restarts and is promoted to memory on read.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, disk_dir: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize, ttl, shared="llm_completions")
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, payload: Any, **options) -> str:
+        canonical = json.dumps(
+            {"model": model, "system": system_prompt, "payload": payload, "options": options},
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        content = self.memory.get(key)
+        if content is not None or self.disk_dir is None:
+            return content
+
+        path = self.disk_dir / f"{key}.json"
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        remaining = entry["created"] + self.ttl - time.time()
+        if remaining <= 0:
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, entry["content"], ttl=remaining)
+        return entry["content"]
+
+    def get_stale(self, key: str) -> Optional[str]:
+        """Return a completion for `key` regardless of age, from memory or disk."""
+        content = self.memory.get_stale(key)
+        if content is not None or self.disk_dir is None:
+            return content
+        try:
+            return json.loads((self.disk_dir / f"{key}.json").read_text())["content"]
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, content: str) -> None:
+        self.memory.set(key, content)
+        if self.disk_dir is None:
+            return
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            path = self.disk_dir / f"{key}.json"
+            tmp_path = path.with_suffix(".json.tmp")
+            tmp_path.write_text(json.dumps({"created": time.time(), "content": content}))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not persist completion cache entry: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.memory.stats()
+        # A disk hit first counts as a memory miss
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] -= self.disk_hits
+        stats["hits"] += self.disk_hits
+        return stats
+
+
+completion_cache = CompletionCache(LLM_CACHE_MAXSIZE, LLM_CACHE_TTL, LLM_CACHE_DIR)
+
+
+def cached_completion(model: str, system_prompt: str, payload: Any,
+                      create: Callable[[], str], **options) -> str:
+    """
+    Return the cached completion for (model, system_prompt, payload, options) or call `create()`.
+    Only successful completions are stored. If `create` fails, an expired completion for the same
+    key is served when UPSTREAM_SERVE_STALE is set; otherwise the exception propagates.
+    """
+    if not LLM_CACHE_ENABLED:
+        return create()
+
+    key = CompletionCache.make_key(model, system_prompt, payload, **options)
+    content = completion_cache.get(key)
+    if content is not None:
+        logger.info("LLM cache hit for %s", key[:12])
+        return content
+
+    try:
+        content = create()
+    except Exception as e:
+        stale = completion_cache.get_stale(key) if UPSTREAM_SERVE_STALE else None
+        if stale is None:
+            raise
+        STALE_RESPONSES.inc(cache="llm_completions")
+        logger.warning("Serving stale completion %s after upstream failure: %s", key[:12], e)
+        return stale
+    completion_cache.set(key, content)
+    return content
@@ -1,18 +1,143 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
 from pathlib import Path
+from app.config import (LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_WHEN,
+                        LOG_BACKUP_COUNT, LOG_INFO_SAMPLE_RATE, LOG_QUEUE_SIZE)
+from app.metrics import Counter, trace_id_var
 
-# Ensure logs directory exists
-Path("logs").mkdir(parents=True, exist_ok=True)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records dropped because the logging queue was full."
+)
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "trace_id"}
+
+
+class TraceIdFilter(logging.Filter):
+    """Stamp each record with the trace ID of the request that produced it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO and DEBUG records; warnings and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including trace ID and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without formatting them, so message interpolation happens on the
+    listener thread. Records are dropped (and counted) rather than blocking when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _LazyFileMixin:
+    """Open the log file, creating its directory, on the first record rather than at import."""
 
-# Set up basic logger configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("logs/app.log"),     # Logs are written to this file
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+
+class LazyRotatingFileHandler(_LazyFileMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class LazyTimedRotatingFileHandler(_LazyFileMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class LazyWatchedFileHandler(_LazyFileMixin, logging.handlers.WatchedFileHandler):
+    pass
+
+
+def _process_log_file() -> str:
+    """LOG_FILE with this process's PID before the extension, e.g. logs/app.12345.log."""
+    path = Path(LOG_FILE)
+    return str(path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}"))
+
+
+def _output_handlers():
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - [%(trace_id)s] %(message)s')
+
+    # Every uvicorn worker runs this. A rotating handler renames its file on its own schedule, so with
+    # rotation on each process writes its own file; without it, all workers append to LOG_FILE and an
+    # outside tool such as logrotate rotates it (the handler reopens the file once it has been moved)
+    if LOG_ROTATE_WHEN:
+        file_handler = LazyTimedRotatingFileHandler(
+            _process_log_file(), when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, delay=True
+        )
+    elif LOG_MAX_BYTES > 0:
+        file_handler = LazyRotatingFileHandler(
+            _process_log_file(), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+        )
+    else:
+        file_handler = LazyWatchedFileHandler(LOG_FILE, delay=True)
+
+    handlers = [
+        file_handler,                            # Logs are written to this file
         logging.StreamHandler(sys.stdout)        # And also printed to console
     ]
-)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+# Callers only enqueue; a background listener thread owns all file and console I/O
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_queue_handler = LazyQueueHandler(_queue)
+_queue_handler.addFilter(SamplingFilter(LOG_INFO_SAMPLE_RATE))
+_queue_handler.addFilter(TraceIdFilter())
+
+_root = logging.getLogger()
+_root.setLevel(LOG_LEVEL)
+_root.addHandler(_queue_handler)
+
+_listener = logging.handlers.QueueListener(_queue, *_output_handlers(), respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
 
-logger = logging.getLogger(__name__)
\ No newline at end of file
+logger = logging.getLogger(__name__)
@@ -1,10 +1,105 @@
-from fastapi import FastAPI, Query
-from app.schemas import QueryRequest, StockDateRange, StockDataResponse, FundamentalsResponse, StockNewsResponse
-from app.services import fetch_stock_data, fetch_stock_fundamentals, fetch_stock_news
-from app.ai_analysis import analyze_stock_trends, ai_process_query, analyze_sentiment
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app.schemas import QueryRequest, StockDateRange, StockDataResponse, BulkStockDataResponse, FundamentalsResponse, StockNewsResponse
+from app.services import (fetch_stock_data, fetch_bulk_stock_data, fetch_stock_fundamentals, fetch_stock_news,
+                          fetch_portfolio_analytics, iter_stock_history, INTERVAL_CHUNK_DAYS)
+from app.utils import expand_symbols
+from app.ai_analysis import analyze_stock_trends, ai_process_query, ai_process_query_events, analyze_sentiment
+from app.cache import cache_stats as service_cache_stats
+from app.llm_cache import completion_cache
+from app.config import TRACE_IDS_ENABLED, TOOL_OUTPUT_FORMAT, WARM_ON_STARTUP, PORTFOLIO_BENCHMARK, PORTFOLIO_MAX_SYMBOLS
+from app.export import EXPORT_FORMATS
 from app.logger import logger
+from app.metrics import REQUEST_LATENCY, register_collector, render_metrics, timed, trace_id_var
+from app.providers import warm_providers
+from app.shared_cache import shared_cache
+from app.symbol_index import symbol_index
+from app.watchlist import watchlist_warmer
 
-app = FastAPI()
+INTERVAL_PATTERN = "^(" + "|".join(INTERVAL_CHUNK_DAYS) + ")$"
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records serialization time as its own stage."""
+
+    def render(self, content) -> bytes:
+        with timed("json_serialization"):
+            return super().render(content)
+
+
+class TimedORJSONResponse(JSONResponse):
+    """orjson-encoded response for trusted internal data; returning it skips response_model validation."""
+
+    def render(self, content) -> bytes:
+        with timed("json_serialization"):
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _cache_metrics():
+    stats = {"llm_completions": completion_cache.stats(), **service_cache_stats()}
+    lines = []
+    # Each family's TYPE line followed by all of its samples, as the exposition format requires
+    for family, kind, field in (("cache_hits_total", "counter", "hits"), ("cache_misses_total", "counter", "misses"),
+                                ("cache_entries", "gauge", "size")):
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(f'{family}{{cache="{name}"}} {cache[field]}' for name, cache in stats.items())
+    return lines
+
+
+register_collector(_cache_metrics)
+
+def _warm_up() -> None:
+    """Import pandas/NumPy and the client libraries, build providers and load the symbol index."""
+    started = time.perf_counter()
+    try:
+        warm_providers()
+        symbol_index.preload()
+        from app import indicators  # noqa: F401
+    except Exception as e:
+        logger.warning("Startup warm-up failed: %s", e)
+        return
+    logger.info("Startup warm-up finished in %.2fs", time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the worker accepts requests straight away
+    warm_up = asyncio.create_task(asyncio.to_thread(_warm_up)) if WARM_ON_STARTUP else None
+    watchlist_warmer.start()
+    yield
+    await watchlist_warmer.stop()
+    if warm_up is not None:
+        await warm_up
+
+
+app = FastAPI(default_response_class=TimedJSONResponse, lifespan=lifespan)
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    trace_id = request.headers.get("X-Trace-Id") or (uuid.uuid4().hex if TRACE_IDS_ENABLED else None)
+    token = trace_id_var.set(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        return response
+    finally:
+        # Label by route template rather than raw URL to keep cardinality bounded
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method,
+                                path=getattr(route, "path", "unmatched"), status=status)
+        trace_id_var.reset(token)
 
 @app.get("/")
 def root():
@@ -12,36 +107,128 @@ def root():
     return {"message": "Welcome to the AI Stock Analysis API"}
 
 @app.get("/get_stock_analysis/", response_model=StockDataResponse)
-def get_stock_analysis(symbol: str, start_date: str = Query(None), end_date: str = Query(None)):
-    logger.info(f"GET /get_stock_analysis/ - {symbol} from {start_date} to {end_date}")
-    stock_data = fetch_stock_data(symbol, start_date, end_date)
-    ai_insights = analyze_stock_trends(stock_data)
-    return {
+def get_stock_analysis(symbol: str, start_date: str = Query(None), end_date: str = Query(None),
+                       include_raw_bars: bool = Query(False),
+                       data_format: str = Query("records", alias="format", pattern="^(records|columnar)$"),
+                       interval: str = Query("1d", pattern=INTERVAL_PATTERN)):
+    logger.info("GET /get_stock_analysis/ - %s from %s to %s (%s)", symbol, start_date, end_date, interval)
+    stock_data = fetch_stock_data(symbol, start_date, end_date, data_format, interval)
+    ai_insights = analyze_stock_trends(stock_data, include_raw_bars, interval)
+    result = {
         "symbol": symbol,
         "start_date": start_date or "Auto-set by service",
         "end_date": end_date or "Auto-set by service",
         "stock_data": stock_data,
         "ai_insights": ai_insights
     }
+    if data_format == "columnar":
+        return TimedORJSONResponse(result)
+    return result
+
+@app.get("/export_stock_data/")
+def export_stock_data(symbol: str, start_date: str = Query(None), end_date: str = Query(None),
+                      interval: str = Query("1d", pattern=INTERVAL_PATTERN),
+                      export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")):
+    logger.info("GET /export_stock_data/ - %s from %s to %s (%s, %s)", symbol, start_date, end_date, interval, export_format)
+    # A malformed date is the client's mistake, not an upstream failure
+    for name, value in (("start_date", start_date), ("end_date", end_date)):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid {name} '{value}': expected YYYY-MM-DD.")
+    frames = iter_stock_history(symbol, start_date, end_date, interval)
+    # Fetch the first chunk before the response starts, so a bad symbol or range still gets an error status
+    try:
+        first = next(frames, None)
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    if first is None:
+        raise HTTPException(status_code=404, detail=f"No data found for {symbol} in the given range.")
+
+    encode, media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        encode(itertools.chain([first], frames)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{symbol}_{interval}.{extension}"'}
+    )
+
+@app.get("/get_bulk_stock_data/", response_model=BulkStockDataResponse)
+def get_bulk_stock_data(symbols: str, start_date: str = Query(None), end_date: str = Query(None)):
+    logger.info("GET /get_bulk_stock_data/ - %s from %s to %s", symbols, start_date, end_date)
+    resolved = expand_symbols(symbols)
+    if not resolved:
+        raise HTTPException(status_code=400, detail="No symbols provided.")
+
+    result = fetch_bulk_stock_data(resolved, start_date, end_date)
+    return {
+        "symbols": resolved,
+        "start_date": start_date or "Auto-set by service",
+        "end_date": end_date or "Auto-set by service",
+        "stock_data": result["stock_data"],
+        "errors": result["errors"]
+    }
+
+@app.get("/get_portfolio_analytics/")
+def get_portfolio_analytics(symbols: str, start_date: str = Query(None), end_date: str = Query(None),
+                            benchmark: str = Query(PORTFOLIO_BENCHMARK), include_matrix: bool = Query(False)):
+    logger.info("GET /get_portfolio_analytics/ - %s from %s to %s vs %s", symbols, start_date, end_date, benchmark)
+    resolved = expand_symbols(symbols)
+    if not resolved:
+        raise HTTPException(status_code=400, detail="No symbols provided.")
+    if len(resolved) > PORTFOLIO_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {PORTFOLIO_MAX_SYMBOLS} symbols per request.")
+    result = fetch_portfolio_analytics(resolved, start_date, end_date, benchmark, include_matrix=include_matrix)
+    return TimedORJSONResponse(result)
 
 @app.post("/ai_stock_analysis/")
 async def ai_stock_analysis(request: QueryRequest):
     query = request.query
-    logger.info(f"POST /ai_stock_analysis/ - query: {query}")
-    result = await ai_process_query(query)
+    logger.info("POST /ai_stock_analysis/ - query: %s", query)
+    data_format = request.format or TOOL_OUTPUT_FORMAT
+    result = await ai_process_query(query, data_format)
+    if data_format == "columnar":
+        return TimedORJSONResponse(result)
     return result
 
+@app.post("/ai_stock_analysis/stream")
+async def ai_stock_analysis_stream(request: QueryRequest):
+    query = request.query
+    logger.info("POST /ai_stock_analysis/stream - query: %s", query)
+
+    async def event_stream():
+        async for event in ai_process_query_events(query, request.format or TOOL_OUTPUT_FORMAT):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/get_stock_fundamentals/", response_model=FundamentalsResponse)
 def get_stock_fundamentals(symbol: str):
-    logger.info(f"GET /get_stock_fundamentals/ - symbol: {symbol}")
+    logger.info("GET /get_stock_fundamentals/ - symbol: %s", symbol)
     return {
         "symbol": symbol,
         "stock_fundamentals": fetch_stock_fundamentals(symbol)
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache_stats/")
+def cache_stats():
+    stats = {"llm_completions": completion_cache.stats(), **service_cache_stats()}
+    if shared_cache is not None:
+        # Summed over every worker on the host
+        stats["shared"] = shared_cache.stats()
+    return stats
+
 # @app.get("/get_stock_sentiment/", response_model=StockNewsResponse)
 # async def get_stock_sentiment(symbol: str, days_back: int = 7):
-#     logger.info(f"GET /get_stock_sentiment/ - symbol: {symbol}, days_back: {days_back}")
+#     logger.info("GET /get_stock_sentiment/ - symbol: %s, days_back: %s", symbol, days_back)
 #     news_data = fetch_stock_news(symbol, days_back)
 #     sentiment = analyze_sentiment(news_data)
 #     return {
@@ -0,0 +1,159 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Trace ID of the request being handled; copied into worker threads by asyncio.to_thread
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+# OpenAI token usage of the ai_process_query call in progress, added to by InstrumentedLLM
+request_tokens_var: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_tokens", default=None)
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = self._header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+STAGE_LATENCY = Histogram(
+    "stage_latency_seconds", "Time spent in each hot-path stage.", ["stage"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "End-to-end HTTP request latency.", ["method", "path", "status"]
+)
+UPSTREAM_CALLS = Counter(
+    "upstream_calls_total", "Calls made to upstream providers.", ["provider", "method", "outcome"]
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_latency_seconds", "Latency of upstream provider calls.", ["provider", "method"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "OpenAI tokens consumed.", ["model", "kind"]
+)
+AI_TOOL_TURNS = Counter(
+    "ai_tool_turns_total", "Model turns taken by the ai_process_query tool loop."
+)
+QUERY_ROUTES = Counter(
+    "ai_query_routes_total", "AI queries by who planned their tool calls: the local router or the model.", ["route"]
+)
+TICKER_RESOLUTIONS = Counter(
+    "ticker_resolutions_total", "Ticker resolutions by where the answer came from.", ["source"]
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Upstream calls retried after a transient error.", ["provider"]
+)
+CIRCUIT_REJECTIONS = Counter(
+    "upstream_circuit_rejections_total", "Upstream calls rejected while the circuit was open.", ["provider"]
+)
+STALE_RESPONSES = Counter(
+    "stale_responses_total", "Expired cached data served because the upstream call failed.", ["cache"]
+)
+WATCHLIST_REFRESHES = Counter(
+    "watchlist_refreshes_total", "Background watchlist refreshes.", ["dataset", "outcome"]
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record how long the enclosed block takes under stage_latency_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage=stage)
+
+
+def register_collector(collector: Callable[[], List[str]]) -> None:
+    """Add a callback returning extra exposition lines computed at scrape time."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,134 @@
+# portfolio.py
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.indicators import TRADING_DAYS, _round
+
+# Pairs listed in each of most_correlated / least_correlated
+TOP_PAIRS = 5
+
+
+def close_panel(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Align each symbol's closes on the union of trading dates: one column per symbol, NaN where it did not trade."""
+    columns = {}
+    for symbol, frame in frames.items():
+        close = frame["Close"].astype(float)
+        index = pd.DatetimeIndex(close.index)
+        # Exchanges differ in time zone; daily bars are compared by trading date
+        close.index = (index.tz_localize(None) if index.tz is not None else index).normalize()
+        columns[symbol] = close[~close.index.duplicated(keep="last")]
+    # Built from a dict so the panel is one float block, not one block per symbol
+    return pd.DataFrame(columns).sort_index()
+
+
+def _values(series: pd.Series, scale: float = 100, digits: int = 2) -> List[Optional[float]]:
+    return [_round(value * scale, digits) for value in series.to_numpy()]
+
+
+def _matrix(frame: pd.DataFrame, scale: float = 1, digits: int = 4) -> Dict[str, Dict[str, Optional[float]]]:
+    return {column: dict(zip(frame.index, _values(frame[column], scale, digits))) for column in frame.columns}
+
+
+def _betas(returns: np.ndarray, benchmark: np.ndarray) -> np.ndarray:
+    """Beta of every column against the benchmark, each over the days both have a return."""
+    valid = ~np.isnan(returns) & ~np.isnan(benchmark)[:, None]
+    counts = valid.sum(axis=0).astype(float)
+    counts[counts < 2] = np.nan
+    x = np.where(valid, returns, 0.0)
+    b = np.where(valid, benchmark[:, None], 0.0)
+    x_dev = np.where(valid, x - x.sum(axis=0) / counts, 0.0)
+    b_dev = np.where(valid, b - b.sum(axis=0) / counts, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (x_dev * b_dev).sum(axis=0) / (b_dev ** 2).sum(axis=0)
+
+
+def _pairs(corr: pd.DataFrame) -> Dict[str, Any]:
+    symbols = np.array(corr.columns)
+    upper = np.triu_indices(len(symbols), 1)
+    values = corr.to_numpy()[upper]
+    finite = np.isfinite(values)
+    first, second, values = upper[0][finite], upper[1][finite], values[finite]
+    order = np.argsort(values)
+
+    def pair(i):
+        return {"symbols": [symbols[first[i]], symbols[second[i]]], "correlation": _round(values[i])}
+
+    return {
+        "mean": _round(values.mean()) if len(values) else None,
+        "most_correlated": [pair(i) for i in order[::-1][:TOP_PAIRS]],
+        "least_correlated": [pair(i) for i in order[:TOP_PAIRS]],
+    }
+
+
+def summarize_portfolio(closes: pd.DataFrame, benchmark_close: Optional[pd.Series] = None,
+                        benchmark: Optional[str] = None, window: int = 20,
+                        max_symbols: Optional[int] = None, include_matrix: bool = False) -> Dict[str, Any]:
+    """
+    Cross-sectional summary of a close panel (one column per symbol), computed column-wise in one pass:
+    total and benchmark-relative returns, relative-strength ranks, annualized and rolling volatility,
+    beta against the benchmark, max drawdown, an equal-weight portfolio and pairwise correlation.
+    `max_symbols` keeps only the leaders and laggards in `rankings`; `include_matrix` adds the full
+    correlation and annualized covariance matrices, which grow with the square of the symbol count.
+    """
+    closes = closes.dropna(axis=1, how="all")
+    returns = closes.pct_change(fill_method=None).iloc[1:]
+    annualize = np.sqrt(TRADING_DAYS)
+
+    total_return = closes.ffill().iloc[-1] / closes.bfill().iloc[0] - 1
+    rolling_vol = returns.rolling(window, min_periods=window).std().ffill()
+    table = pd.DataFrame({
+        "rank": total_return.rank(ascending=False, method="min"),
+        "total_return_pct": total_return,
+        "rs_percentile": total_return.rank(pct=True),
+        "annualized_volatility_pct": returns.std() * annualize,
+        f"rolling_{window}d_volatility_pct": rolling_vol.iloc[-1] * annualize if len(rolling_vol) else np.nan,
+        "max_drawdown_pct": (closes / closes.cummax() - 1).min(),
+    })
+
+    summary: Dict[str, Any] = {
+        "period": {"start": closes.index[0].strftime("%Y-%m-%d"), "end": closes.index[-1].strftime("%Y-%m-%d"),
+                   "bars": len(closes)},
+    }
+
+    if benchmark_close is not None and benchmark_close.notna().sum() > 1:
+        benchmark_close = benchmark_close.reindex(closes.index)
+        benchmark_return = benchmark_close.ffill().iloc[-1] / benchmark_close.bfill().iloc[0] - 1
+        benchmark_returns = benchmark_close.pct_change(fill_method=None).iloc[1:].to_numpy()
+        table["relative_return_pct"] = total_return - benchmark_return
+        table["beta"] = _betas(returns.to_numpy(), benchmark_returns)
+        summary["benchmark"] = {"symbol": benchmark, "total_return_pct": _round(benchmark_return * 100, 2)}
+
+    equal_weight = returns.mean(axis=1)
+    summary["equal_weight"] = {
+        "total_return_pct": _round(((1 + equal_weight).prod() - 1) * 100, 2),
+        "annualized_volatility_pct": _round(equal_weight.std() * annualize * 100, 2),
+    }
+
+    table = table.sort_values(["rank", "total_return_pct"], na_position="last")
+    if max_symbols and len(table) > max_symbols:
+        # Leaders and laggards carry the signal; the middle of the ranking is summarized by its count.
+        # An odd limit gives the extra row to the leaders
+        leaders = (max_symbols + 1) // 2
+        laggards = max_symbols - leaders
+        summary["omitted_symbols"] = len(table) - max_symbols
+        table = pd.concat([table.head(leaders), table.tail(laggards)]) if laggards else table.head(leaders)
+    rankings = {"symbol": list(table.index), "rank": [None if np.isnan(r) else int(r) for r in table["rank"]]}
+    for column in table.columns.drop("rank"):
+        if column == "rs_percentile":
+            rankings[column] = _values(table[column], 100, 1)
+        elif column == "beta":
+            rankings[column] = _values(table[column], 1, 3)
+        else:
+            rankings[column] = _values(table[column])
+    summary["rankings"] = [dict(zip(rankings, row)) for row in zip(*rankings.values())]
+
+    if len(closes.columns) > 1:
+        corr = returns.corr()
+        summary["correlation"] = _pairs(corr)
+        if include_matrix:
+            summary["correlation"]["matrix"] = _matrix(corr)
+            summary["covariance_annualized"] = _matrix(returns.cov() * TRADING_DAYS, digits=6)
+
+    return summary
@@ -0,0 +1,396 @@
+# providers.py
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from app.config import (OPEN_API_KEY, PROVIDER_MODE, FIXTURES_DIR,
+                        REPLAY_LATENCY_MS, REPLAY_LLM_LATENCY_MS, REPLAY_ERROR_RATE)
+from app.logger import logger
+from app.metrics import LLM_TOKENS, UPSTREAM_CALLS, UPSTREAM_LATENCY, request_tokens_var
+from app.upstream import TransientUpstreamError, policies
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class FixtureNotFound(LookupError):
+    """Raised in replay mode when no recorded fixture matches an upstream call."""
+
+
+class LiveMarketData:
+    """Market data straight from yfinance and yahooquery."""
+
+    def history(self, symbol: str, start: str, end: str, interval: str = "1d") -> "pd.DataFrame":
+        import yfinance as yf
+        return yf.Ticker(symbol).history(start=start, end=end, interval=interval)
+
+    def download(self, symbols: List[str], start: str, end: str) -> "pd.DataFrame":
+        import yfinance as yf
+        return yf.download(
+            symbols, start=start, end=end,
+            group_by="ticker", auto_adjust=True, threads=True, progress=False
+        )
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        import yfinance as yf
+        return yf.Ticker(symbol).info
+
+    def recommendations(self, symbol: str) -> Optional["pd.DataFrame"]:
+        import yfinance as yf
+        return yf.Ticker(symbol).recommendations
+
+    def news(self, symbol: str) -> List[Dict[str, Any]]:
+        import yfinance as yf
+        return yf.Ticker(symbol).news
+
+    def search(self, query: str) -> Dict[str, Any]:
+        from yahooquery import search
+        return search(query)
+
+
+def _frame_to_fixture(frame: Optional["pd.DataFrame"]) -> Optional[Dict[str, Any]]:
+    import pandas as pd
+    if frame is None:
+        return None
+    multi = isinstance(frame.columns, pd.MultiIndex)
+    return {
+        "tz": str(frame.index.tz) if getattr(frame.index, "tz", None) else None,
+        "datetime_index": isinstance(frame.index, pd.DatetimeIndex),
+        "index": [str(i) for i in frame.index],
+        "columns": [list(c) for c in frame.columns] if multi else list(frame.columns),
+        "multi": multi,
+        # Python floats round-trip exactly through JSON, unlike DataFrame.to_json
+        "data": frame.astype(object).where(frame.notna(), None).values.tolist(),
+    }
+
+
+def _frame_from_fixture(fixture: Optional[Dict[str, Any]]) -> Optional["pd.DataFrame"]:
+    import pandas as pd
+    if fixture is None:
+        return None
+    columns = pd.MultiIndex.from_tuples([tuple(c) for c in fixture["columns"]]) if fixture["multi"] \
+        else fixture["columns"]
+    index = fixture["index"]
+    if fixture["datetime_index"]:
+        index = pd.to_datetime(pd.Index(index).str[:19])
+        if fixture["tz"]:
+            index = index.tz_localize(fixture["tz"])
+    return pd.DataFrame(fixture["data"], index=index, columns=columns).infer_objects()
+
+
+# How each market data method's result is written to and read from a JSON fixture
+_MARKET_CODECS = {
+    "history": (_frame_to_fixture, _frame_from_fixture),
+    "download": (_frame_to_fixture, _frame_from_fixture),
+    "recommendations": (_frame_to_fixture, _frame_from_fixture),
+    "info": (lambda v: v, lambda v: v),
+    "news": (lambda v: v, lambda v: v),
+    "search": (lambda v: v, lambda v: v),
+}
+
+
+class FixtureStore:
+    """Recorded upstream responses, one JSON file per (method, arguments) pair."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    @staticmethod
+    def key(method: str, arguments: Any) -> str:
+        canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+        return f"{method}-{hashlib.sha256(canonical.encode()).hexdigest()[:20]}"
+
+    def load(self, method: str, arguments: Any) -> Any:
+        path = self.root / f"{self.key(method, arguments)}.json"
+        try:
+            return json.loads(path.read_text())["response"]
+        except FileNotFoundError:
+            raise FixtureNotFound(f"No fixture for {method} {json.dumps(arguments, default=str)[:200]}")
+
+    def save(self, method: str, arguments: Any, response: Any) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{self.key(method, arguments)}.json"
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps({"method": method, "arguments": arguments, "response": response}, default=str))
+        os.replace(tmp_path, path)
+
+
+def _fixture_arguments(args: tuple, kwargs: Dict[str, Any]) -> List[Any]:
+    # Keyword arguments are only part of the key when given, so earlier recordings still match
+    return [*args, kwargs] if kwargs else list(args)
+
+
+class RecordingMarketData:
+    """Passes calls through to `base` and saves every response as a fixture."""
+
+    def __init__(self, base, store: FixtureStore):
+        self.base = base
+        self.store = store
+
+    def __getattr__(self, method: str):
+        if method not in _MARKET_CODECS:
+            raise AttributeError(method)
+        encode, _ = _MARKET_CODECS[method]
+
+        def call(*args, **kwargs):
+            response = getattr(self.base, method)(*args, **kwargs)
+            self.store.save(method, _fixture_arguments(args, kwargs), encode(response))
+            return response
+
+        return call
+
+
+def _inject_fault(error_rate: float, method: str) -> None:
+    if error_rate and random.random() < error_rate:
+        raise TransientUpstreamError(f"Injected transient failure in {method}")
+
+
+class ReplayMarketData:
+    """
+    Serves recorded fixtures instead of calling upstream, after an optional artificial delay.
+    A fraction `error_rate` of calls fail with a transient error to exercise retries and circuit breaking.
+    """
+
+    def __init__(self, store: FixtureStore, latency_ms: float = 0, error_rate: float = 0):
+        self.store = store
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+
+    def __getattr__(self, method: str):
+        if method not in _MARKET_CODECS:
+            raise AttributeError(method)
+        _, decode = _MARKET_CODECS[method]
+
+        def call(*args, **kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            _inject_fault(self.error_rate, method)
+            return decode(self.store.load(method, _fixture_arguments(args, kwargs)))
+
+        return call
+
+
+def _chat_client(create) -> SimpleNamespace:
+    """Wrap a create function in the `client.chat.completions.create` shape of the OpenAI client."""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+class RecordingLLM:
+    """OpenAI-client stand-in that forwards to `base` and records completions, including streams."""
+
+    def __init__(self, base, store: FixtureStore):
+        self.base = base
+        self.store = store
+        self.chat = _chat_client(self.create).chat
+
+    def create(self, **kwargs):
+        response = self.base.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            self.store.save("chat", kwargs, response.model_dump())
+            return response
+        return self._record_stream(kwargs, response)
+
+    def _record_stream(self, kwargs, stream):
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk.model_dump())
+            yield chunk
+        self.store.save("chat", kwargs, chunks)
+
+
+class ReplayLLM:
+    """OpenAI-client stand-in that serves recorded completions with optional delay and injected failures."""
+
+    def __init__(self, store: FixtureStore, latency_ms: float = 0, error_rate: float = 0):
+        self.store = store
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.chat = _chat_client(self.create).chat
+
+    def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+        response = self.store.load("chat", kwargs)
+        if self.latency:
+            time.sleep(self.latency)
+        _inject_fault(self.error_rate, "chat")
+        if not kwargs.get("stream"):
+            return ChatCompletion.model_validate(response)
+        return iter([ChatCompletionChunk.model_validate(chunk) for chunk in response])
+
+
+class InstrumentedMarketData:
+    """Counts and times every market data call made through `base`."""
+
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, method: str):
+        if method not in _MARKET_CODECS:
+            raise AttributeError(method)
+        provider = "yahooquery" if method == "search" else "yfinance"
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                response = getattr(self.base, method)(*args, **kwargs)
+                outcome = "ok"
+                return response
+            finally:
+                UPSTREAM_CALLS.inc(provider=provider, method=method, outcome=outcome)
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, provider=provider, method=method)
+
+        return call
+
+
+class InstrumentedLLM:
+    """Counts, times and tallies token usage of every completion made through `base`."""
+
+    def __init__(self, base):
+        self.base = base
+        self.chat = _chat_client(self.create).chat
+
+    def create(self, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.base.chat.completions.create(**kwargs)
+            outcome = "ok"
+        finally:
+            UPSTREAM_CALLS.inc(provider="openai", method="chat", outcome=outcome)
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, provider="openai", method="chat")
+        if not kwargs.get("stream"):
+            self._count_usage(kwargs.get("model"), response.usage)
+            return response
+        return self._stream(kwargs.get("model"), response)
+
+    def _stream(self, model, stream):
+        for chunk in stream:
+            # Only present on the last chunk when stream_options.include_usage is set
+            self._count_usage(model, getattr(chunk, "usage", None))
+            yield chunk
+
+    @staticmethod
+    def _count_usage(model, usage) -> None:
+        if usage is None:
+            return
+        LLM_TOKENS.inc(usage.prompt_tokens, model=model, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, model=model, kind="completion")
+        request_tokens = request_tokens_var.get()
+        if request_tokens is not None:
+            request_tokens["prompt_tokens"] += usage.prompt_tokens
+            request_tokens["completion_tokens"] += usage.completion_tokens
+
+
+class ResilientMarketData:
+    """Routes every market data call through its provider's UpstreamPolicy."""
+
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, method: str):
+        if method not in _MARKET_CODECS:
+            raise AttributeError(method)
+        policy = policies["yahooquery" if method == "search" else "yfinance"]
+
+        def call(*args, **kwargs):
+            return policy.call(getattr(self.base, method), *args, **kwargs)
+
+        return call
+
+
+class ResilientLLM:
+    """
+    Routes completions through the OpenAI UpstreamPolicy. For streams, only opening
+    the stream is limited and retried; chunks are read outside the policy.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.chat = _chat_client(self.create).chat
+
+    def create(self, **kwargs):
+        return policies["openai"].call(self.base.chat.completions.create, **kwargs)
+
+
+def _wrap_market_data(market_data):
+    return ResilientMarketData(InstrumentedMarketData(market_data))
+
+
+def _wrap_llm(llm_client):
+    return ResilientLLM(InstrumentedLLM(llm_client))
+
+
+def _build_market_data(mode: str):
+    if mode == "replay":
+        logger.info("Using replayed market data fixtures from %s", FIXTURES_DIR)
+        return ReplayMarketData(FixtureStore(FIXTURES_DIR), REPLAY_LATENCY_MS, REPLAY_ERROR_RATE)
+    if mode == "record":
+        logger.info("Recording market data responses to %s", FIXTURES_DIR)
+        return RecordingMarketData(LiveMarketData(), FixtureStore(FIXTURES_DIR))
+    return LiveMarketData()
+
+
+def _build_llm_client(mode: str):
+    if mode == "replay":
+        logger.info("Using replayed OpenAI fixtures from %s", FIXTURES_DIR)
+        return ReplayLLM(FixtureStore(FIXTURES_DIR), REPLAY_LLM_LATENCY_MS, REPLAY_ERROR_RATE)
+
+    # The openai package is slow to import, so it is only loaded once a client is needed
+    from openai import OpenAI
+    llm = OpenAI(api_key=OPEN_API_KEY)
+    if mode == "record":
+        logger.info("Recording OpenAI responses to %s", FIXTURES_DIR)
+        return RecordingLLM(llm, FixtureStore(FIXTURES_DIR))
+    return llm
+
+
+# Built on first use rather than at import, to keep worker startup fast
+_market_data = None
+_llm_client = None
+_providers_lock = threading.Lock()
+
+
+def get_market_data():
+    global _market_data
+    if _market_data is None:
+        with _providers_lock:
+            if _market_data is None:
+                _market_data = _wrap_market_data(_build_market_data(PROVIDER_MODE))
+    return _market_data
+
+
+def get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        with _providers_lock:
+            if _llm_client is None:
+                _llm_client = _wrap_llm(_build_llm_client(PROVIDER_MODE))
+    return _llm_client
+
+
+def warm_providers() -> None:
+    """Build both providers and import the live client libraries ahead of the first request."""
+    get_market_data()
+    get_llm_client()
+    if PROVIDER_MODE == "replay":
+        import openai.types.chat  # noqa: F401
+    else:
+        import yfinance  # noqa: F401
+        import yahooquery  # noqa: F401
+
+
+def set_providers(market_data=None, llm_client=None) -> None:
+    """Swap the active providers, e.g. to drive the app from synthetic or recorded data."""
+    global _market_data, _llm_client
+    if market_data is not None:
+        _market_data = _wrap_market_data(market_data)
+    if llm_client is not None:
+        _llm_client = _wrap_llm(llm_client)
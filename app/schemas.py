@@ -1,8 +1,10 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Literal
 
 class QueryRequest(BaseModel):
     query: str
+    # Shape of stock_data in the response: "records" (default) or "columnar"
+    format: Optional[Literal["records", "columnar"]] = None
 
 class StockDateRange(BaseModel):
     symbol: str
@@ -16,6 +18,13 @@ class StockDataResponse(BaseModel):
     stock_data: Dict[str, Dict]
     ai_insights: str
 
+class BulkStockDataResponse(BaseModel):
+    symbols: List[str]
+    start_date: str
+    end_date: str
+    stock_data: Dict[str, Dict[str, Dict[str, Optional[float]]]]
+    errors: Dict[str, str] = {}
+
 class FundamentalsResponse(BaseModel):
     symbol: str
     stock_fundamentals: Dict[str, Optional[float]]
@@ -1,86 +1,302 @@
-import yfinance as yf
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Iterator, List
+from app.bar_store import bar_store
+from app.cache import cached
+from app.config import (BAR_STORE_ENABLED, FUNDAMENTALS_CACHE_TTL, RECOMMENDATIONS_CACHE_TTL, NEWS_CACHE_TTL,
+                        PORTFOLIO_BENCHMARK, PORTFOLIO_LOOKBACK_DAYS, PORTFOLIO_VOLATILITY_WINDOW)
 from app.logger import logger
+from app.metrics import timed
+from app.providers import get_market_data
 
-def fetch_stock_data(symbol: str, start_date: str = None, end_date: str = None) -> dict:
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Bar sizes accepted by yfinance, mapped to the span of one request when a range is pulled in chunks.
+# Intraday spans stay within Yahoo's per-request limits (7 days for 1m bars).
+INTERVAL_CHUNK_DAYS = {
+    "1m": 7, "2m": 30, "5m": 30, "15m": 30, "30m": 30, "60m": 90, "90m": 30, "1h": 90,
+    "1d": 365, "5d": 365, "1wk": 3650, "1mo": 3650, "3mo": 3650,
+}
+
+def _download_history(symbol: str, start_date: str, end_date: str, interval: str = "1d") -> "pd.DataFrame":
+    # Daily bars keep the original call shape, so previously recorded fixtures still replay
+    kwargs = {} if interval == "1d" else {"interval": interval}
+    return get_market_data().history(symbol, start_date, end_date, **kwargs)
+
+def _history(symbol: str, start_date: str, end_date: str, interval: str = "1d") -> "pd.DataFrame":
+    """Bars for [start_date, end_date), from the bar store when enabled."""
+    if BAR_STORE_ENABLED:
+        return bar_store.get_history(
+            symbol, start_date, end_date,
+            lambda start, end: _download_history(symbol, start, end, interval),
+            interval
+        )
+    return _download_history(symbol, start_date, end_date, interval)
+
+def _default_range(start_date: str = None, end_date: str = None) -> tuple:
     if not start_date or not end_date:
         end_date = datetime.today().strftime('%Y-%m-%d')
         start_date = (datetime.today() - timedelta(days=2)).strftime('%Y-%m-%d')
+    return start_date, end_date
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def _to_records(data: "pd.DataFrame") -> dict:
+    """{timestamp: {column: value}}, the default response shape, built without iterrows."""
+    frame = data[OHLCV_COLUMNS]
+    rows = frame.to_numpy().tolist()
+    return {
+        timestamp: dict(zip(OHLCV_COLUMNS, row))
+        for timestamp, row in zip(frame.index.astype(str), rows)
+    }
+
+def _to_columnar(data: "pd.DataFrame") -> dict:
+    """Parallel arrays of timestamps and OHLCV values; smaller and much cheaper to build and serialize."""
+    frame = data[OHLCV_COLUMNS]
+    columnar = {"timestamps": frame.index.astype(str).tolist()}
+    for column in OHLCV_COLUMNS:
+        columnar[column] = frame[column].tolist()
+    return columnar
+
+DATA_FORMATS = {"records": _to_records, "columnar": _to_columnar}
 
-    logger.info(f"Fetching stock data for {symbol} from {start_date} to {end_date}")
+@timed("fetch_stock_data")
+def fetch_stock_data(symbol: str, start_date: str = None, end_date: str = None, data_format: str = "records",
+                     interval: str = "1d") -> dict:
+    """
+    Fetch OHLCV history for a symbol at the given bar `interval`. `data_format` selects the result shape:
+    "records" ({timestamp: {column: value}}, the default) or "columnar" (parallel arrays).
+    """
+    start_date, end_date = _default_range(start_date, end_date)
+
+    logger.info("Fetching %s stock data for %s from %s to %s", interval, symbol, start_date, end_date)
 
     try:
-        stock = yf.Ticker(symbol)
-        data = stock.history(start=start_date, end=end_date)
+        with timed("history_lookup"):
+            data = _history(symbol, start_date, end_date, interval)
 
         if data.empty:
-            logger.warning(f"No data found for {symbol} between {start_date} and {end_date}")
+            logger.warning("No data found for %s between %s and %s", symbol, start_date, end_date)
             return {"error": f"No data found for {symbol} from {start_date} to {end_date}."}
 
-        stock_data = {
-            str(date): row.to_dict()
-            for date, row in data[['Open', 'High', 'Low', 'Close', 'Volume']].iterrows()
-        }
+        with timed("records_conversion"):
+            stock_data = DATA_FORMATS[data_format](data)
 
-        logger.info(f"Fetched {len(stock_data)} records for {symbol}")
+        logger.info("Fetched %s records for %s", len(data), symbol)
         return stock_data
 
     except Exception as e:
-        logger.error(f"Error fetching data for {symbol}: {e}")
+        logger.error("Error fetching data for %s: %s", symbol, e)
         raise ValueError(f"Error fetching data for {symbol}: {str(e)}")
 
+def iter_stock_history(symbol: str, start_date: str = None, end_date: str = None,
+                       interval: str = "1d") -> Iterator["pd.DataFrame"]:
+    """
+    Yield the OHLCV bars for a range one chunk at a time (INTERVAL_CHUNK_DAYS per chunk),
+    so only a single chunk is held in memory however long the range is. Empty chunks are skipped.
+    Chunks come straight from the provider: going through the bar store would load and rewrite
+    the symbol's whole accumulated file for every chunk.
+    """
+    start_date, end_date = _default_range(start_date, end_date)
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    step = timedelta(days=INTERVAL_CHUNK_DAYS[interval])
+    logger.info("Streaming %s stock data for %s from %s to %s", interval, symbol, start_date, end_date)
+
+    while start < end:
+        chunk_end = min(start + step, end)
+        try:
+            with timed("history_lookup"):
+                data = _download_history(symbol, start.isoformat(), chunk_end.isoformat(), interval)
+        except Exception as e:
+            logger.error("Error fetching data for %s from %s to %s: %s", symbol, start, chunk_end, e)
+            raise ValueError(f"Error fetching data for {symbol}: {str(e)}")
+        if not data.empty:
+            yield data[OHLCV_COLUMNS]
+        start = chunk_end
+
+def _download_bulk_history(symbols: List[str], start_date: str, end_date: str) -> Dict[str, "pd.DataFrame"]:
+    """Fetch several symbols with one batched yfinance download and split it per symbol."""
+    import pandas as pd
+    data = get_market_data().download(symbols, start_date, end_date)
+    frames = {}
+    for symbol in symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0):
+                continue
+            frame = data[symbol]
+        else:
+            frame = data
+        # Symbols that failed or did not trade come back as all-NaN rows
+        frames[symbol] = frame.dropna(how="all")
+    return frames
+
+def _bulk_frames(symbols: List[str], start_date: str, end_date: str) -> tuple:
+    """
+    Per-symbol OHLCV frames for one date range plus per-symbol errors.
+    Symbols not already held in the bar store are fetched together in a single batched download.
+    """
+    try:
+        with timed("bulk_history_lookup"):
+            if BAR_STORE_ENABLED:
+                gaps = {symbol: bar_store.missing_ranges(symbol, start_date, end_date) for symbol in symbols}
+                to_fetch = [symbol for symbol, ranges in gaps.items() if ranges]
+                if to_fetch:
+                    # One download spanning every symbol's gaps; the store de-duplicates overlapping bars
+                    fetch_start = min(start for symbol in to_fetch for start, _ in gaps[symbol])
+                    fetch_end = max(end for symbol in to_fetch for _, end in gaps[symbol])
+                    fetched = _download_bulk_history(to_fetch, fetch_start, fetch_end)
+                    for symbol, frame in fetched.items():
+                        bar_store.put(symbol, fetch_start, fetch_end, frame)
+                frames = {symbol: bar_store.read(symbol, start_date, end_date) for symbol in symbols}
+            else:
+                frames = _download_bulk_history(symbols, start_date, end_date)
+
+    except Exception as e:
+        logger.error("Error fetching bulk data for %s: %s", symbols, e)
+        raise ValueError(f"Error fetching bulk data for {', '.join(symbols)}: {str(e)}")
+
+    errors = {}
+    for symbol in symbols:
+        if symbol not in frames or frames[symbol].empty:
+            logger.warning("No data found for %s between %s and %s", symbol, start_date, end_date)
+            errors[symbol] = f"No data found for {symbol} from {start_date} to {end_date}."
+            frames.pop(symbol, None)
+    return frames, errors
+
+@timed("fetch_bulk_stock_data")
+def fetch_bulk_stock_data(symbols: List[str], start_date: str = None, end_date: str = None) -> dict:
+    """
+    Fetch price history for many symbols over one date range.
+    Returns per-symbol records aligned on the same dates, plus per-symbol errors.
+    """
+    start_date, end_date = _default_range(start_date, end_date)
+    symbols = [symbol.strip().upper() for symbol in symbols]
+    logger.info("Fetching bulk stock data for %s symbols from %s to %s", len(symbols), start_date, end_date)
+    frames, errors = _bulk_frames(symbols, start_date, end_date)
+
+    # Align every symbol on the union of trading dates; missing bars become nulls
+    for symbol, frame in frames.items():
+        frame = frame[OHLCV_COLUMNS].copy()
+        frame.index = frame.index.strftime('%Y-%m-%d')
+        frames[symbol] = frame
+    dates = sorted(set().union(*(frame.index for frame in frames.values())))
+    stock_data = {}
+    with timed("records_conversion"):
+        for symbol, frame in frames.items():
+            aligned = frame.reindex(dates)
+            stock_data[symbol] = _to_records(aligned.astype(object).where(aligned.notna(), None))
+
+    logger.info("Fetched %s aligned records for %s symbols", len(dates), len(stock_data))
+    return {"stock_data": stock_data, "errors": errors}
+
+@timed("fetch_portfolio_analytics")
+def fetch_portfolio_analytics(symbols: List[str], start_date: str = None, end_date: str = None,
+                              benchmark: str = PORTFOLIO_BENCHMARK, max_symbols: int = None,
+                              include_matrix: bool = False) -> dict:
+    """
+    Compare a group of symbols over one range (the last PORTFOLIO_LOOKBACK_DAYS by default).
+    Their closes are aligned into one panel, fetched together with the benchmark in a single bulk
+    load, and summarized locally by app.portfolio; see summarize_portfolio for the fields.
+    """
+    from app.portfolio import close_panel, summarize_portfolio
+
+    if not start_date or not end_date:
+        end_date = datetime.today().strftime('%Y-%m-%d')
+        start_date = (datetime.today() - timedelta(days=PORTFOLIO_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols))
+    benchmark = (benchmark or "").strip().upper()
+    logger.info("Computing portfolio analytics for %s symbols from %s to %s against %s",
+                len(symbols), start_date, end_date, benchmark or "no benchmark")
+
+    frames, errors = _bulk_frames(symbols + ([benchmark] if benchmark and benchmark not in symbols else []),
+                                  start_date, end_date)
+    closes = close_panel({symbol: frames[symbol] for symbol in symbols if symbol in frames})
+    if closes.empty:
+        raise ValueError(f"No data found for {', '.join(symbols)} from {start_date} to {end_date}.")
+    benchmark_close = close_panel({benchmark: frames[benchmark]})[benchmark] if benchmark in frames else None
+
+    with timed("portfolio_analytics"):
+        summary = summarize_portfolio(closes, benchmark_close, benchmark, PORTFOLIO_VOLATILITY_WINDOW,
+                                      max_symbols, include_matrix)
+    return {"symbols": list(closes.columns), **summary, "errors": errors}
+
+@timed("fetch_stock_fundamentals")
+@cached("fundamentals", ttl=FUNDAMENTALS_CACHE_TTL)
 def fetch_stock_fundamentals(symbol: str) -> dict:
-    logger.info(f"Fetching fundamentals for {symbol}")
+    logger.info("Fetching fundamentals for %s", symbol)
     try:
-        stock = yf.Ticker(symbol)
+        info = get_market_data().info(symbol)
         fundamentals = {
-            "Market Cap": stock.info.get("marketCap"),
-            "P/E Ratio": stock.info.get("trailingPE"),
-            "Dividend Yield": stock.info.get("dividendYield"),
-            "EPS": stock.info.get("trailingEps"),
-            "52 Week High": stock.info.get("fiftyTwoWeekHigh"),
-            "52 Week Low": stock.info.get("fiftyTwoWeekLow")
+            "Market Cap": info.get("marketCap"),
+            "P/E Ratio": info.get("trailingPE"),
+            "Dividend Yield": info.get("dividendYield"),
+            "EPS": info.get("trailingEps"),
+            "52 Week High": info.get("fiftyTwoWeekHigh"),
+            "52 Week Low": info.get("fiftyTwoWeekLow")
         }
 
         if not fundamentals:
-            logger.warning(f"No fundamentals found for {symbol}")
+            logger.warning("No fundamentals found for %s", symbol)
             return {"error": f"No fundamentals found for {symbol}."}
 
-        logger.info(f"Fetched fundamentals for {symbol}")
+        logger.info("Fetched fundamentals for %s", symbol)
         return fundamentals
 
     except Exception as e:
-        logger.error(f"Error fetching fundamentals for {symbol}: {e}")
+        logger.error("Error fetching fundamentals for %s: %s", symbol, e)
         raise ValueError(f"Error fetching fundamentals for {symbol}: {str(e)}")
 
+@timed("fetch_analyst_recommendations")
+@cached("recommendations", ttl=RECOMMENDATIONS_CACHE_TTL)
 def fetch_analyst_recommendations(symbol: str) -> dict:
-    logger.info(f"Fetching analyst recommendations for {symbol}")
+    logger.info("Fetching analyst recommendations for %s", symbol)
     try:
-        stock = yf.Ticker(symbol)
-        recs = stock.recommendations
+        recs = get_market_data().recommendations(symbol)
 
         if recs is None or recs.empty:
-            logger.warning(f"No analyst recommendations found for {symbol}")
+            logger.warning("No analyst recommendations found for %s", symbol)
             return {"symbol": symbol, "recommendations": []}
 
         latest_recs = recs.tail(5).to_dict(orient='records')
-        logger.info(f"Fetched {len(latest_recs)} analyst recommendations for {symbol}")
+        logger.info("Fetched %s analyst recommendations for %s", len(latest_recs), symbol)
         return {"symbol": symbol, "recommendations": latest_recs}
 
     except Exception as e:
-        logger.error(f"Error fetching analyst recommendations for {symbol}: {e}")
+        logger.error("Error fetching analyst recommendations for %s: %s", symbol, e)
         raise ValueError(f"Error fetching analyst recommendations for {symbol}: {str(e)}")
 
+def compact_article(item: dict) -> dict:
+    """Headline, publisher and UTC publish time of a news item, in either yfinance news shape."""
+    # Newer yfinance releases nest the article under "content" with a provider object and ISO pubDate
+    content = item.get("content") or item
+    provider = content.get("provider")
+    publisher = provider.get("displayName") if isinstance(provider, dict) else content.get("publisher")
+
+    published = None
+    try:
+        if content.get("providerPublishTime"):
+            published = datetime.fromtimestamp(content["providerPublishTime"], tz=timezone.utc)
+        elif content.get("pubDate"):
+            published = datetime.fromisoformat(content["pubDate"].replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        pass
+
+    return {
+        "headline": (content.get("title") or "").strip(),
+        "publisher": publisher,
+        "time": published.strftime("%Y-%m-%dT%H:%MZ") if published else None,
+    }
+
+@timed("fetch_stock_news")
+@cached("news", ttl=NEWS_CACHE_TTL)
 def fetch_stock_news(symbol: str, days_back: int = 7) -> dict:
     """Fetch recent news articles for a stock and return them with basic metadata"""
-    logger.info(f"Fetching news for {symbol} from last {days_back} days")
+    logger.info("Fetching news for %s from last %s days", symbol, days_back)
     try:
-        stock = yf.Ticker(symbol)
-        news = stock.news
+        news = get_market_data().news(symbol)
         
         if not news:
-            logger.warning(f"No news found for {symbol}")
+            logger.warning("No news found for %s", symbol)
             return {"symbol": symbol, "news": []}
         
         # Filter news by date if possible
@@ -96,12 +312,12 @@ def fetch_stock_news(symbol: str, days_back: int = 7) -> dict:
                 else:
                     recent_news.append(item)  # Include if we can't check date
             except Exception as e:
-                logger.warning(f"Error processing news item: {e}")
+                logger.warning("Error processing news item: %s", e)
                 recent_news.append(item)  # Include anyway
         
-        logger.info(f"Fetched {len(recent_news)} news items for {symbol}")
+        logger.info("Fetched %s news items for %s", len(recent_news), symbol)
         return {"symbol": symbol, "news": recent_news}
     
     except Exception as e:
-        logger.error(f"Error fetching news for {symbol}: {e}")
+        logger.error("Error fetching news for %s: %s", symbol, e)
         raise ValueError(f"Error fetching news for {symbol}: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,223 @@
+# shared_cache.py
+import atexit
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import orjson
+
+from app.config import SHARED_CACHE_ENABLED, SHARED_CACHE_PATH, SHARED_CACHE_MAX_MB
+from app.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+CREATE TABLE IF NOT EXISTS counters (
+    namespace TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Seconds a connection waits for another worker's write lock before the operation fails
+BUSY_TIMEOUT = 2
+# Seconds between writes of a worker's buffered hit/miss counts
+COUNTER_FLUSH_INTERVAL = 5
+# A worker checks the total entry size after every this many sets
+EVICTION_CHECK_EVERY = 64
+
+
+def _json_default(value: Any) -> Any:
+    # pandas Timestamps and NumPy scalars, e.g. in analyst recommendation records
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def shared_key(key: Hashable) -> str:
+    """Text form of an in-process cache key. Keys are built from plain arguments, so repr is the same in every worker."""
+    return key if isinstance(key, str) else repr(key)
+
+
+class SharedCache:
+    """
+    Key/value cache in a single SQLite file that every worker on the host opens in WAL mode,
+    so reads never wait for a writer. Values are stored as JSON, so a tampered file cannot run
+    code in the workers and tuples come back as lists; each entry carries a wall-clock expiry.
+    Expired entries are kept for stale serving until the size cap evicts them; eviction
+    removes the entries that expire soonest first.
+    Hit/miss counts are buffered per worker and summed in the file, so stats() covers the host.
+    SQLite errors and undecodable entries are logged and treated as misses: the shared tier never
+    fails a request. Undecodable entries are also deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self._flushed_at = time.monotonic()
+        self._sets = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit: each statement is its own transaction unless one is opened explicitly
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Still consistent after a crash in WAL mode; at worst the last few sets are lost
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _fetch(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires FROM entries WHERE namespace = ? AND key = ?", (namespace, shared_key(key))
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Shared cache read failed for %s: %s", namespace, e)
+            return None
+        if row is None:
+            return None
+        try:
+            return orjson.loads(row[0]), row[1]
+        except Exception as e:
+            # Truncated, or written by an older release that pickled its values
+            logger.warning("Dropping undecodable shared cache entry in %s: %s", namespace, e)
+            self.delete(namespace, key)
+            return None
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """(value, seconds left) for an entry that has not expired, otherwise None."""
+        found = self._fetch(namespace, key)
+        if found is None:
+            return None
+        remaining = found[1] - time.time()
+        return (found[0], remaining) if remaining > 0 else None
+
+    def get_stale(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        """Return the entry for `key` even if it has expired."""
+        found = self._fetch(namespace, key)
+        return default if found is None else found[0]
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        try:
+            blob = orjson.dumps(value, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, size, expires) VALUES (?, ?, ?, ?, ?)",
+                (namespace, shared_key(key), blob, len(blob), time.time() + ttl)
+            )
+        except (sqlite3.Error, TypeError) as e:
+            logger.warning("Shared cache write failed for %s: %s", namespace, e)
+            return
+        with self._lock:
+            self._sets += 1
+            check = self._sets % EVICTION_CHECK_EVERY == 0
+        if check:
+            self.evict()
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        try:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, shared_key(key)))
+        except sqlite3.Error as e:
+            logger.warning("Shared cache delete failed for %s: %s", namespace, e)
+
+    def evict(self) -> int:
+        """Delete the entries that expire soonest until the total size is under max_bytes; returns the count."""
+        try:
+            conn = self._conn()
+            # Take the write lock up front so two workers do not evict at the same time
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+                doomed = []
+                if excess > 0:
+                    # Free an extra tenth of the cap so the next sets do not trigger another pass straight away
+                    excess += self.max_bytes // 10
+                    for rowid, size in conn.execute("SELECT rowid, size FROM entries ORDER BY expires").fetchall():
+                        doomed.append((rowid,))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    conn.executemany("DELETE FROM entries WHERE rowid = ?", doomed)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Shared cache eviction failed: %s", e)
+            return 0
+        if doomed:
+            logger.info("Evicted %d shared cache entries", len(doomed))
+        return len(doomed)
+
+    def record(self, namespace: str, hit: bool) -> None:
+        """Count a lookup in an in-process cache backed by `namespace`."""
+        with self._lock:
+            self._counts[namespace][0 if hit else 1] += 1
+            due = time.monotonic() - self._flushed_at >= COUNTER_FLUSH_INTERVAL
+        if due:
+            self.flush_counts()
+
+    def flush_counts(self) -> None:
+        with self._lock:
+            counts, self._counts = self._counts, defaultdict(lambda: [0, 0])
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        try:
+            self._conn().executemany(
+                "INSERT INTO counters (namespace, hits, misses) VALUES (?, ?, ?) ON CONFLICT (namespace) "
+                "DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(namespace, hits, misses) for namespace, (hits, misses) in counts.items()]
+            )
+        except sqlite3.Error as e:
+            logger.warning("Could not write shared cache counters: %s", e)
+
+    def clear(self, namespace: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            logger.warning("Could not clear shared cache namespace %s: %s", namespace, e)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Entries, bytes, hits and misses per namespace, summed over every worker on the host."""
+        self.flush_counts()
+        try:
+            conn = self._conn()
+            stats = {
+                namespace: {"size": size, "bytes": total, "hits": 0, "misses": 0}
+                for namespace, size, total in conn.execute(
+                    "SELECT namespace, COUNT(*), SUM(size) FROM entries GROUP BY namespace")
+            }
+            for namespace, hits, misses in conn.execute("SELECT namespace, hits, misses FROM counters"):
+                stats.setdefault(namespace, {"size": 0, "bytes": 0}).update(hits=hits, misses=misses)
+        except sqlite3.Error as e:
+            logger.warning("Could not read shared cache stats: %s", e)
+            return {}
+        return stats
+
+
+# The file is opened on first use, so importing this module touches nothing on disk
+shared_cache: Optional[SharedCache] = (
+    SharedCache(SHARED_CACHE_PATH, int(SHARED_CACHE_MAX_MB * 2 ** 20))
+    if SHARED_CACHE_ENABLED and SHARED_CACHE_PATH else None
+)
+if shared_cache is not None:
+    atexit.register(shared_cache.flush_counts)
@@ -0,0 +1,168 @@
+# symbol_index.py
+import csv
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import SYMBOL_INDEX_CACHE
+from app.logger import logger
+from app.shared_cache import shared_cache
+
+BUNDLED_LISTING = Path(__file__).parent / "data" / "symbols.csv"
+# Remote resolutions are shared with the other workers on the host for this long
+SHARED_ALIAS_TTL = 30 * 86400
+
+# Corporate suffixes dropped so "Apple Inc." and "apple" normalize to the same key
+_SUFFIXES = re.compile(
+    r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|llc|sa|se|nv|ag|holdings?|group|"
+    r"class [abc]|the)\b"
+)
+
+
+def normalize(text: str) -> str:
+    text = text.lower().replace("&", " and ").replace(".com", "")
+    text = re.sub(r"[^a-z0-9^ ]+", " ", text)
+    text = _SUFFIXES.sub(" ", text)
+    return " ".join(text.split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SymbolIndex:
+    """
+    In-memory symbol/company-name index with exact and trigram fuzzy lookup.
+    Loaded from the bundled listing plus a cache file of names resolved remotely,
+    which `remember` keeps up to date. Names resolved by other workers are picked up
+    from the shared cache on a local miss.
+    """
+
+    def __init__(self, listing: Path, cache_path: Optional[str]):
+        self.listing = listing
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._symbols: Set[str] = set()
+        self._exact: Dict[str, str] = {}
+        self._keys: List[Tuple[str, int]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._learned: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def preload(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self.listing, newline="") as f:
+                    for row in csv.DictReader(f):
+                        aliases = [a for a in (row.get("aliases") or "").split("|") if a]
+                        self._add(row["symbol"], [row["name"], *aliases])
+            except OSError as e:
+                logger.warning("Could not load bundled symbol listing: %s", e)
+
+            if self.cache_path and self.cache_path.exists():
+                try:
+                    self._learned = json.loads(self.cache_path.read_text())
+                    for alias, entry in self._learned.items():
+                        self._add(entry["symbol"], [alias, entry.get("name") or ""])
+                except (OSError, ValueError) as e:
+                    logger.warning("Could not load symbol index cache: %s", e)
+
+            self._loaded = True
+            logger.info("Symbol index loaded with %s keys", len(self._keys))
+
+    def lookup(self, query: str) -> Optional[str]:
+        """Exact match on a symbol, company name or alias."""
+        self.preload()
+        symbol = query.strip().upper()
+        if symbol in self._symbols:
+            return symbol
+        alias = normalize(query)
+        return self._exact.get(alias) or self._shared_lookup(alias)
+
+    def is_symbol(self, text: str) -> bool:
+        self.preload()
+        return text.strip().upper() in self._symbols
+
+    def lookup_name(self, text: str) -> Optional[str]:
+        """Exact match on a company name or alias only; unlike lookup, never reads `text` as a ticker."""
+        self.preload()
+        return self._exact.get(normalize(text))
+
+    def _shared_lookup(self, alias: str) -> Optional[str]:
+        if shared_cache is None:
+            return None
+        entry = shared_cache.get_stale("symbol_aliases", alias)
+        shared_cache.record("symbol_aliases", entry is not None)
+        if entry is None:
+            return None
+        with self._lock:
+            self._add(entry["symbol"], [alias, entry.get("name") or ""])
+            self._learned[alias] = entry
+        return entry["symbol"]
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Fuzzy match by trigram Jaccard similarity; returns (symbol, score) best first."""
+        self.preload()
+        query_grams = _trigrams(normalize(query))
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for key_id in self._postings.get(gram, ()):
+                overlap[key_id] += 1
+
+        best: Dict[str, float] = {}
+        for key_id, shared in overlap.items():
+            symbol, key_grams = self._keys[key_id]
+            score = shared / (len(query_grams) + key_grams - shared)
+            if score > best.get(symbol, 0.0):
+                best[symbol] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def remember(self, query: str, symbol: str, name: Optional[str] = None) -> None:
+        """Memoize a remote resolution so the next lookup for `query` stays local."""
+        self.preload()
+        alias = normalize(query)
+        with self._lock:
+            if self._exact.get(alias) == symbol:
+                return
+            self._add(symbol, [alias, name or ""])
+            self._learned[alias] = {"symbol": symbol, "name": name}
+            learned = json.dumps(self._learned)
+        if shared_cache is not None:
+            shared_cache.set("symbol_aliases", alias, self._learned[alias], SHARED_ALIAS_TTL)
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            tmp_path.write_text(learned)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not persist symbol index cache: %s", e)
+
+    def _add(self, symbol: str, names: List[str]) -> None:
+        symbol = symbol.upper()
+        if symbol not in self._symbols:
+            self._symbols.add(symbol)
+            self._index_key(symbol.lower(), symbol)
+        for name in names:
+            key = normalize(name)
+            if key and key not in self._exact:
+                self._exact[key] = symbol
+                self._index_key(key, symbol)
+
+    def _index_key(self, key: str, symbol: str) -> None:
+        grams = _trigrams(key)
+        key_id = len(self._keys)
+        self._keys.append((symbol, len(grams)))
+        for gram in grams:
+            self._postings[gram].append(key_id)
+
+
+symbol_index = SymbolIndex(BUNDLED_LISTING, SYMBOL_INDEX_CACHE)
@@ -0,0 +1,100 @@
+# token_budget.py
+import json
+from typing import Any, Dict, List
+
+# Rough size of a token for English text and JSON; good enough for budgeting, not for billing
+CHARS_PER_TOKEN = 4
+# Per-message overhead the chat format adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def _stock_data_digest(stock_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Bar count, first/last close and change for either stock_data shape."""
+    if "error" in stock_data:
+        return stock_data
+    if "timestamps" in stock_data:
+        timestamps, closes = stock_data["timestamps"], stock_data["Close"]
+    else:
+        timestamps = sorted(stock_data)
+        closes = [stock_data[timestamp]["Close"] for timestamp in timestamps]
+    if not timestamps:
+        return {"bars": 0}
+    first, last = closes[0], closes[-1]
+    return {
+        "bars": len(timestamps),
+        "first": {"date": timestamps[0][:10], "close": round(first, 2)},
+        "last": {"date": timestamps[-1][:10], "close": round(last, 2)},
+        "change_pct": round((last / first - 1) * 100, 2) if first else None,
+    }
+
+
+def digest_tool_content(content: Dict[str, Any], max_tokens: int) -> Dict[str, Any]:
+    """
+    Shrink a tool result the model has already read. Raw price history becomes a short digest;
+    any other field that is still too large is truncated.
+    """
+    digest: Dict[str, Any] = {}
+    for key, value in content.items():
+        if key == "stock_data" and isinstance(value, dict):
+            digest["stock_data_digest"] = _stock_data_digest(value)
+            continue
+        serialized = value if isinstance(value, str) else json.dumps(value)
+        if estimate_tokens(serialized) > max_tokens:
+            value = serialized[:max_tokens * CHARS_PER_TOKEN] + "... [truncated]"
+        digest[key] = value
+    return digest
+
+
+class TokenBudget:
+    """
+    Keeps the ai_process_query message history within a turn cap and a prompt-token ceiling.
+    Tool results are sent in full once; after the model has consumed them they are
+    replaced with compact digests before the next turn.
+    """
+
+    def __init__(self, max_turns: int, max_prompt_tokens: int, digest_threshold: int):
+        self.max_turns = max_turns
+        self.max_prompt_tokens = max_prompt_tokens
+        self.digest_threshold = digest_threshold
+        self.turns = 0
+        self.compacted = 0
+        self.peak_prompt_tokens = 0
+        self._tool_messages: List[tuple] = []
+        self._consumed = 0
+
+    def add_tool_message(self, message: Dict[str, Any], content: Dict[str, Any]) -> None:
+        self._tool_messages.append((message, content))
+
+    def start_turn(self, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Compact consumed tool results and count the turn.
+        Returns False when the turn cap or the token ceiling means the model must answer without tools.
+        """
+        for message, content in self._tool_messages[:self._consumed]:
+            if estimate_tokens(message["content"]) > self.digest_threshold:
+                message["content"] = json.dumps(digest_tool_content(content, self.digest_threshold))
+                self.compacted += 1
+        # Everything in the history now will have been read by the model once this turn runs
+        self._consumed = len(self._tool_messages)
+
+        self.turns += 1
+        prompt_tokens = messages_tokens(messages)
+        self.peak_prompt_tokens = max(self.peak_prompt_tokens, prompt_tokens)
+        return self.turns < self.max_turns and prompt_tokens < self.max_prompt_tokens
+
+    def report(self, usage: Dict[str, int]) -> Dict[str, int]:
+        return {
+            "turns": self.turns,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "peak_estimated_prompt_tokens": self.peak_prompt_tokens,
+            "compacted_tool_messages": self.compacted,
+        }
@@ -0,0 +1,163 @@
+# upstream.py
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import (UPSTREAM_MAX_RETRIES, UPSTREAM_BACKOFF_BASE, UPSTREAM_BACKOFF_MAX,
+                        CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+                        YFINANCE_CONCURRENCY, YFINANCE_RATE_PER_SEC,
+                        YAHOOQUERY_CONCURRENCY, YAHOOQUERY_RATE_PER_SEC,
+                        OPENAI_CONCURRENCY, OPENAI_RATE_PER_SEC)
+from app.logger import logger
+from app.metrics import CIRCUIT_REJECTIONS, UPSTREAM_RETRIES, register_collector
+
+
+class TransientUpstreamError(RuntimeError):
+    """A failure worth retrying, e.g. a timeout or rate limit. Raised by fake providers to inject faults."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling upstream while a provider's circuit breaker is open."""
+
+
+# Exception class names (anywhere in the MRO) treated as transient. Matching by name keeps
+# yfinance, requests, curl_cffi and openai out of the import path.
+_TRANSIENT_NAMES = {
+    "TransientUpstreamError", "TimeoutError", "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout",
+    "YFRateLimitError", "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+}
+_TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: BaseException) -> bool:
+    if any(cls.__name__ in _TRANSIENT_NAMES for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status in _TRANSIENT_STATUS
+
+
+class TokenBucket:
+    """Blocking rate limiter: `rate` calls per second on average with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls for `reset_timeout`
+    seconds. Then a single trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class UpstreamPolicy:
+    """
+    Shared call path for one provider: circuit breaker, concurrency cap, token-bucket rate
+    limit and jittered exponential retry of transient errors. Non-transient errors are raised
+    straight away and do not count against the circuit.
+    """
+
+    def __init__(self, name: str, concurrency: int, rate: float, burst: Optional[float] = None,
+                 retries: int = UPSTREAM_MAX_RETRIES, backoff_base: float = UPSTREAM_BACKOFF_BASE,
+                 backoff_max: float = UPSTREAM_BACKOFF_MAX):
+        self.name = name
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        self.bucket = TokenBucket(rate, burst or max(1.0, rate))
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.breaker.allow():
+            CIRCUIT_REJECTIONS.inc(provider=self.name)
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                with self._slots:
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The provider answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                if attempt == self.retries:
+                    self.breaker.record_failure()
+                    raise
+                # Full jitter keeps retries from many callers from arriving together
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                UPSTREAM_RETRIES.inc(provider=self.name)
+                logger.warning("%s call failed (%s); retry %d/%d in %.2fs",
+                               self.name, e, attempt + 1, self.retries, delay)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+
+policies: Dict[str, UpstreamPolicy] = {
+    "yfinance": UpstreamPolicy("yfinance", YFINANCE_CONCURRENCY, YFINANCE_RATE_PER_SEC),
+    "yahooquery": UpstreamPolicy("yahooquery", YAHOOQUERY_CONCURRENCY, YAHOOQUERY_RATE_PER_SEC),
+    "openai": UpstreamPolicy("openai", OPENAI_CONCURRENCY, OPENAI_RATE_PER_SEC),
+}
+
+
+def _circuit_metrics() -> List[str]:
+    lines = ["# TYPE upstream_circuit_open gauge"]
+    for name, policy in policies.items():
+        lines.append(f'upstream_circuit_open{{provider="{name}"}} {int(policy.breaker.state != "closed")}')
+    return lines
+
+
+register_collector(_circuit_metrics)
@@ -1,8 +1,10 @@
 #utils.py
-from yahooquery import search
+from app.config import SYMBOL_MATCH_THRESHOLD
 from app.logger import logger
+from app.metrics import TICKER_RESOLUTIONS, timed
+from app.providers import get_market_data
+from app.symbol_index import symbol_index
 from typing import Union, List
-from difflib import get_close_matches
 
 ACRONYM_GROUPS = {
     "FAANG": ["META", "AAPL", "AMZN", "NFLX", "GOOG"],
@@ -12,49 +14,69 @@ ACRONYM_GROUPS = {
     "GAFM": ["GOOG", "AMZN", "FB", "MSFT"]
 }
 
+def expand_symbols(symbols: str) -> List[str]:
+    """Comma-separated tickers, with acronym groups such as FAANG expanded in place and duplicates dropped."""
+    resolved = []
+    for item in symbols.split(","):
+        item = item.strip().upper()
+        for symbol in ACRONYM_GROUPS.get(item, [item] if item else []):
+            if symbol not in resolved:
+                resolved.append(symbol)
+    return resolved
+
+@timed("resolve_ticker")
 def resolve_ticker(company_name: str) -> Union[str, List[str]]:
     """
-    Resolve a company name or acronym group to its stock ticker symbol(s) using yahooquery.
+    Resolve a company name or acronym group to its stock ticker symbol(s).
+    Known names are resolved from the local symbol index; anything else falls back to a yahooquery search
+    and the result is remembered in the index.
     Returns ticker symbol(s) or raises ValueError with suggestion if possible.
     """
     company_upper = company_name.strip().upper()
     
     # First check if it's a known acronym group
     if company_upper in ACRONYM_GROUPS:
-        logger.info(f"Resolved acronym group {company_upper} to tickers: {ACRONYM_GROUPS[company_upper]}")
+        logger.info("Resolved acronym group %s to tickers: %s", company_upper, ACRONYM_GROUPS[company_upper])
+        TICKER_RESOLUTIONS.inc(source="acronym")
         return ACRONYM_GROUPS[company_upper]
 
-    logger.info(f"Resolving ticker for: {company_name}")
+    # Then try the local symbol index: exact symbol/name/alias, then a confident fuzzy match
+    symbol = symbol_index.lookup(company_name)
+    if symbol:
+        logger.info("Resolved ticker locally: %s", symbol)
+        TICKER_RESOLUTIONS.inc(source="index")
+        return symbol
+    matches = symbol_index.search(company_name, limit=1)
+    if matches and matches[0][1] >= SYMBOL_MATCH_THRESHOLD:
+        logger.info("Resolved ticker by fuzzy match: %s (score %.2f)", matches[0][0], matches[0][1])
+        TICKER_RESOLUTIONS.inc(source="fuzzy")
+        return matches[0][0]
+
+    logger.info("Resolving ticker for: %s", company_name)
     try:
-        results = search(company_name)
+        results = get_market_data().search(company_name)
         quotes = results.get("quotes", [])
 
         if quotes:
             symbol = quotes[0]["symbol"]  # Get the first match
-            logger.info(f"Resolved ticker: {symbol}")
+            logger.info("Resolved ticker: %s", symbol)
+            TICKER_RESOLUTIONS.inc(source="remote")
+            symbol_index.remember(company_name, symbol, quotes[0].get("longname") or quotes[0].get("shortname"))
             return symbol
-        
-        # If no exact match found, try to suggest similar tickers
-        all_possible_symbols = []
-        for group in ACRONYM_GROUPS.values():
-            all_possible_symbols.extend(group)
-        
-        for quote in quotes:
-            if 'symbol' in quote:
-                all_possible_symbols.append(quote['symbol'])
-        
-        # Find closest match (minimum similarity: 60%)
-        suggestions = get_close_matches(company_upper, all_possible_symbols, n=1, cutoff=0.6)
-        
-        if suggestions:
-            error_msg = f"No ticker found for '{company_name}'. Did you mean '{suggestions[0]}'?"
-            logger.warning(f"Ticker resolution failed with suggestion: {error_msg}")
-            raise ValueError(error_msg)
-        else:
-            error_msg = f"No ticker found for '{company_name}'. Please check the company name."
-            logger.warning(f"Ticker resolution failed: {error_msg}")
-            raise ValueError(error_msg)
-        
+
     except Exception as e:
-        logger.error(f"Error resolving ticker for {company_name}: {e}")
-        raise ValueError(f"Could not process request for '{company_name}'. Please try again.")
\ No newline at end of file
+        TICKER_RESOLUTIONS.inc(source="failed")
+        logger.error("Error resolving ticker for %s: %s", company_name, e)
+        raise ValueError(f"Could not process request for '{company_name}'. Please try again.")
+
+    TICKER_RESOLUTIONS.inc(source="failed")
+    # If no match found, suggest the closest known symbol from the local index
+    suggestions = symbol_index.search(company_name, limit=1)
+    if suggestions and suggestions[0][1] >= 0.3:
+        error_msg = f"No ticker found for '{company_name}'. Did you mean '{suggestions[0][0]}'?"
+        logger.warning("Ticker resolution failed with suggestion: %s", error_msg)
+        raise ValueError(error_msg)
+    else:
+        error_msg = f"No ticker found for '{company_name}'. Please check the company name."
+        logger.warning("Ticker resolution failed: %s", error_msg)
+        raise ValueError(error_msg)
@@ -0,0 +1,166 @@
+# watchlist.py
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, IO, List, Optional
+from zoneinfo import ZoneInfo
+
+from app.config import (WATCHLIST, WATCHLIST_FILE, WATCHLIST_LOOKBACK_DAYS, WATCHLIST_PRICE_INTERVAL,
+                        WATCHLIST_NEWS_INTERVAL, WATCHLIST_FUNDAMENTALS_INTERVAL, WATCHLIST_OFF_HOURS_FACTOR,
+                        WATCHLIST_WARM_TRENDS, WATCHLIST_CONCURRENCY, WATCHLIST_LOCK_PATH, BAR_STORE_ENABLED,
+                        MARKET_TIMEZONE, MARKET_OPEN, MARKET_CLOSE)
+from app.ai_analysis import analyze_stock_trends
+from app.bar_store import market_today
+from app.logger import logger
+from app.metrics import WATCHLIST_REFRESHES
+from app.services import fetch_stock_data, fetch_stock_fundamentals, fetch_stock_news
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker runs its own warmer
+    fcntl = None
+
+# days_back the AI news tool uses, so warmed entries share its cache key
+NEWS_DAYS_BACK = 7
+
+
+def load_watchlist() -> List[str]:
+    symbols = WATCHLIST.split(",")
+    if WATCHLIST_FILE and Path(WATCHLIST_FILE).exists():
+        symbols += Path(WATCHLIST_FILE).read_text().splitlines()
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+
+
+def in_market_hours(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now(ZoneInfo(MARKET_TIMEZONE))
+    return now.weekday() < 5 and MARKET_OPEN <= now.strftime("%H:%M") < MARKET_CLOSE
+
+
+def _refresh_prices(symbol: str, ttl: float) -> None:
+    if BAR_STORE_ENABLED:
+        # Keeps the whole lookback window on disk and today's provisional bars fresh. The end is
+        # exclusive, so the range runs through tomorrow for today's live bar to be requested
+        end = market_today() + timedelta(days=1)
+        start = end - timedelta(days=WATCHLIST_LOOKBACK_DAYS)
+        fetch_stock_data(symbol, start.isoformat(), end.isoformat())
+    if WATCHLIST_WARM_TRENDS:
+        analyze_stock_trends(fetch_stock_data(symbol))
+
+
+def _refresh_fundamentals(symbol: str, ttl: float) -> None:
+    fetch_stock_fundamentals.refresh((symbol,), ttl=ttl)
+
+
+def _refresh_news(symbol: str, ttl: float) -> None:
+    fetch_stock_news.refresh((symbol, NEWS_DAYS_BACK), ttl=ttl)
+
+
+@dataclass
+class RefreshJob:
+    dataset: str
+    interval: float
+    refresh: Callable[[str, float], None]
+
+
+class WatchlistWarmer:
+    """
+    Refreshes each dataset for every watched symbol off the request path. After an initial
+    warm-up pass, refreshes are spread evenly over each dataset's interval so upstream load
+    stays flat; intervals stretch by WATCHLIST_OFF_HOURS_FACTOR outside market hours.
+    With several uvicorn workers, only the one holding `lock_path` runs it, so upstream
+    calls are not multiplied by the worker count.
+    """
+
+    def __init__(self, symbols: List[str], jobs: List[RefreshJob], concurrency: int = WATCHLIST_CONCURRENCY,
+                 lock_path: Optional[str] = WATCHLIST_LOCK_PATH):
+        self.symbols = symbols
+        self.jobs = jobs
+        self.concurrency = concurrency
+        self.lock_path = lock_path
+        self._lock_file: Optional[IO] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def interval(self, job: RefreshJob) -> float:
+        return job.interval if in_market_hours() else job.interval * WATCHLIST_OFF_HOURS_FACTOR
+
+    async def _refresh(self, job: RefreshJob, symbol: str) -> None:
+        # Cached entries outlive two refresh cycles, so one failed refresh does not leave them cold
+        ttl = 2 * self.interval(job)
+        try:
+            await asyncio.to_thread(job.refresh, symbol, ttl)
+            WATCHLIST_REFRESHES.inc(dataset=job.dataset, outcome="ok")
+        except Exception as e:
+            WATCHLIST_REFRESHES.inc(dataset=job.dataset, outcome="error")
+            logger.warning("Watchlist %s refresh failed for %s: %s", job.dataset, symbol, e)
+
+    async def _run(self, job: RefreshJob, offset: float) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(symbol):
+            async with semaphore:
+                await self._refresh(job, symbol)
+
+        await asyncio.gather(*(warm(symbol) for symbol in self.symbols))
+        logger.info("Watchlist %s warmed for %d symbols", job.dataset, len(self.symbols))
+
+        await asyncio.sleep(offset)
+        while True:
+            spacing = self.interval(job) / len(self.symbols)
+            for symbol in self.symbols:
+                started = time.monotonic()
+                await self._refresh(job, symbol)
+                await asyncio.sleep(max(0.0, spacing - (time.monotonic() - started)))
+
+    def _acquire(self) -> bool:
+        """Take the host-wide warmer lock without waiting. The OS releases it if the worker dies."""
+        if fcntl is None or not self.lock_path:
+            return True
+        path = Path(self.lock_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self) -> None:
+        if not self.symbols or not self.jobs:
+            return
+        if not self._acquire():
+            logger.info("Watchlist warmer is running in another worker")
+            return
+        logger.info("Starting watchlist warmer for %d symbols: %s",
+                    len(self.symbols), ", ".join(job.dataset for job in self.jobs))
+        for i, job in enumerate(self.jobs):
+            # Offset datasets from each other so their upstream calls do not line up
+            offset = self.interval(job) / len(self.symbols) * i / len(self.jobs)
+            self._tasks.append(asyncio.create_task(self._run(job, offset), name=f"watchlist-{job.dataset}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _default_jobs() -> List[RefreshJob]:
+    jobs = []
+    if BAR_STORE_ENABLED or WATCHLIST_WARM_TRENDS:
+        jobs.append(RefreshJob("prices", WATCHLIST_PRICE_INTERVAL, _refresh_prices))
+    # Nothing to keep warm when the corresponding cache is disabled
+    if fetch_stock_fundamentals.cache.ttl > 0:
+        jobs.append(RefreshJob("fundamentals", WATCHLIST_FUNDAMENTALS_INTERVAL, _refresh_fundamentals))
+    if fetch_stock_news.cache.ttl > 0:
+        jobs.append(RefreshJob("news", WATCHLIST_NEWS_INTERVAL, _refresh_news))
+    return jobs
+
+
+watchlist_warmer = WatchlistWarmer(load_watchlist(), _default_jobs())
@@ -0,0 +1,169 @@
+# bench_endpoints.py
+"""
+Offline latency/throughput benchmark for the app.main endpoints.
+
+Upstream Yahoo and OpenAI calls are served from recorded fixtures (PROVIDER_MODE=replay)
+with configurable injected latency, so results are reproducible on any Linux box.
+If the fixture directory is empty, a fixture set is first recorded from the
+deterministic synthetic providers in bench/synthetic.py.
+
+    python -m bench.bench_endpoints --concurrency 1,8,32 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=str(ROOT / "bench" / "fixtures"),
+                        help="Directory of recorded upstream fixtures")
+    parser.add_argument("--synthesize", action="store_true",
+                        help="Re-record the fixture set from the synthetic providers")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Injected latency per market data call")
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="Injected latency per OpenAI call")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="Fraction of replayed upstream calls that fail with a transient error")
+    parser.add_argument("--endpoints", default="stock_analysis,fundamentals,ai_analysis",
+                        help="Comma-separated subset of scenarios to run")
+    parser.add_argument("--router", action="store_true",
+                        help="Let the local intent router answer simple AI queries without model planning")
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Keep the bar store, completion cache and TTL caches enabled")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def _configure_env(args) -> None:
+    """Point the app at replayed fixtures; must run before app modules are imported."""
+    os.environ["PROVIDER_MODE"] = "replay"
+    os.environ["FIXTURES_DIR"] = args.fixtures
+    os.environ["REPLAY_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["REPLAY_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["REPLAY_ERROR_RATE"] = str(args.error_rate)
+    # Measure the app, not the production rate limits
+    for name in ("YFINANCE_RATE_PER_SEC", "YAHOOQUERY_RATE_PER_SEC", "OPENAI_RATE_PER_SEC"):
+        os.environ.setdefault(name, "0")
+    os.environ["SYMBOL_INDEX_CACHE"] = ""
+    # Off by default so ai_analysis keeps measuring the model loop
+    os.environ["AI_ROUTER_ENABLED"] = "true" if args.router else "false"
+    os.environ["BAR_STORE_DIR"] = tempfile.mkdtemp(prefix="bench-bars-")
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-shared-"), "cache.sqlite3")
+    if not args.with_caches:
+        os.environ["BAR_STORE_ENABLED"] = "false"
+        os.environ["SHARED_CACHE_ENABLED"] = "false"
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        for name in ("FUNDAMENTALS_CACHE_TTL", "RECOMMENDATIONS_CACHE_TTL", "NEWS_CACHE_TTL"):
+            os.environ[name] = "0"
+
+
+def _scenarios(symbols: List[str], start_date: str, end_date: str) -> Dict[str, Callable]:
+    def stock_analysis(client, i):
+        symbol = symbols[i % len(symbols)]
+        return client.get("/get_stock_analysis/",
+                          params={"symbol": symbol, "start_date": start_date, "end_date": end_date})
+
+    def fundamentals(client, i):
+        return client.get("/get_stock_fundamentals/", params={"symbol": symbols[i % len(symbols)]})
+
+    def ai_analysis(client, i):
+        first, second = symbols[i % len(symbols)], symbols[(i + 1) % len(symbols)]
+        return client.post("/ai_stock_analysis/", json={"query": f"Compare the price trends of {first} and {second}"})
+
+    def ai_simple(client, i):
+        # A lookup the intent router can answer; with --router it replays the stock_analysis fixtures
+        query = f"{symbols[i % len(symbols)]} price from {start_date} to {end_date}"
+        return client.post("/ai_stock_analysis/", json={"query": query})
+
+    return {"stock_analysis": stock_analysis, "fundamentals": fundamentals, "ai_analysis": ai_analysis,
+            "ai_simple": ai_simple}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def _run(client, scenario: Callable, requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    next_request = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            started = time.perf_counter()
+            response = await scenario(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "rps": requests / elapsed,
+    }
+
+
+async def _main(args) -> List[Dict]:
+    import httpx
+    from app import providers
+    from app.main import app
+    from bench.synthetic import SYMBOLS, START_DATE, END_DATE, SyntheticLLM, SyntheticMarketData
+
+    store = providers.FixtureStore(args.fixtures)
+    scenarios = _scenarios(SYMBOLS, START_DATE, END_DATE)
+    selected = [name.strip() for name in args.endpoints.split(",")]
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        if args.synthesize or not any(Path(args.fixtures).glob("*.json")):
+            print(f"Recording synthetic fixtures to {args.fixtures}", file=sys.stderr)
+            providers.set_providers(providers.RecordingMarketData(SyntheticMarketData(), store),
+                                    providers.RecordingLLM(SyntheticLLM(), store))
+            for name in selected:
+                for i in range(len(SYMBOLS)):
+                    await scenarios[name](client, i)
+            providers.set_providers(providers.ReplayMarketData(store, args.latency_ms, args.error_rate),
+                                    providers.ReplayLLM(store, args.llm_latency_ms, args.error_rate))
+
+        results = []
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            for name in selected:
+                stats = await _run(client, scenarios[name], args.requests, concurrency)
+                results.append({"endpoint": name, "concurrency": concurrency, **stats})
+                print(f"{name:<16} c={concurrency:<4} p50={stats['p50_ms']:8.1f}ms p95={stats['p95_ms']:8.1f}ms "
+                      f"p99={stats['p99_ms']:8.1f}ms rps={stats['rps']:8.1f} errors={stats['errors']}")
+        return results
+
+
+def main():
+    args = _parse_args()
+    _configure_env(args)
+    sys.path.insert(0, str(ROOT))
+    results = asyncio.run(_main(args))
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
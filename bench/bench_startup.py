@@ -0,0 +1,125 @@
+# bench_startup.py
+"""
+Cold-start benchmark for an app worker.
+
+Each run starts a fresh interpreter against replayed fixtures and measures:
+importing app.main, total time from process spawn until the lifespan has started,
+and the latency of the first and second /get_stock_analysis/ requests
+(optionally after --delay-ms of idle time, to see the effect of the startup warm-up).
+Medians over all runs are reported.
+
+    python -m bench.bench_startup --runs 5
+    python -m bench.bench_startup --runs 5 --delay-ms 2000
+    python -m bench.bench_startup --runs 5 --delay-ms 2000 --no-warm-up
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs in the child interpreter and writes its timings as JSON to `out`
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app.main import app
+imported = time.perf_counter()
+
+import httpx
+
+async def main():
+    params = {params!r}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        ready, ready_at = time.perf_counter(), time.time()
+        await asyncio.sleep({delay})
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            timings = []
+            for _ in range(2):
+                request_started = time.perf_counter()
+                response = await client.get("/get_stock_analysis/", params=params)
+                response.raise_for_status()
+                timings.append(time.perf_counter() - request_started)
+    with open({out!r}, "w") as out:
+        json.dump({{
+            "import_s": imported - started,
+            "lifespan_ready_s": ready - started,
+            "ready_at": ready_at,
+            "first_request_ms": timings[0] * 1000,
+            "second_request_ms": timings[1] * 1000,
+        }}, out)
+
+asyncio.run(main())
+"""
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    parser.add_argument("--fixtures", default=str(ROOT / "bench" / "fixtures"),
+                        help="Directory of recorded upstream fixtures")
+    parser.add_argument("--delay-ms", type=float, default=0,
+                        help="Idle time between startup and the first request, e.g. to let the warm-up finish")
+    parser.add_argument("--no-warm-up", action="store_true", help="Run with WARM_ON_STARTUP=false")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+def _ensure_fixtures(fixtures: str, log_dir: str) -> None:
+    """Record the synthetic fixture set through the endpoint benchmark if none exists yet."""
+    if any(Path(fixtures).glob("*.json")):
+        return
+    print(f"Recording synthetic fixtures to {fixtures}", file=sys.stderr)
+    subprocess.run([sys.executable, "-m", "bench.bench_endpoints", "--fixtures", fixtures,
+                    "--endpoints", "stock_analysis", "--concurrency", "1", "--requests", "1"],
+                   cwd=ROOT, env=dict(os.environ, LOG_FILE=f"{log_dir}/record.log"),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def _run_once(args, log_dir: str, params: Dict[str, str]) -> Dict[str, float]:
+    env = dict(os.environ,
+               PROVIDER_MODE="replay", FIXTURES_DIR=args.fixtures, LOG_FILE=f"{log_dir}/app.log",
+               SYMBOL_INDEX_CACHE="", BAR_STORE_ENABLED="false", LLM_CACHE_ENABLED="false",
+               SHARED_CACHE_ENABLED="false",
+               WARM_ON_STARTUP="false" if args.no_warm_up else "true")
+    out = Path(log_dir) / "timings.json"
+    probe = _PROBE.format(root=str(ROOT), params=params, delay=args.delay_ms / 1000, out=str(out))
+    spawned = time.time()
+    subprocess.run([sys.executable, "-c", probe], env=env, cwd=log_dir, check=True, capture_output=True)
+    timings = json.loads(out.read_text())
+    # Includes interpreter startup, which the in-process timings cannot see
+    timings["spawn_to_ready_s"] = timings.pop("ready_at") - spawned
+    return timings
+
+
+def main():
+    args = _parse_args()
+    sys.path.insert(0, str(ROOT))
+    from bench.synthetic import SYMBOLS, START_DATE, END_DATE
+    params = {"symbol": SYMBOLS[0], "start_date": START_DATE, "end_date": END_DATE}
+
+    runs: List[Dict[str, float]] = []
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as log_dir:
+        _ensure_fixtures(args.fixtures, log_dir)
+        for _ in range(args.runs):
+            runs.append(_run_once(args, log_dir, params))
+
+    results = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    print(f"import={results['import_s'] * 1000:8.1f}ms lifespan_ready={results['lifespan_ready_s'] * 1000:8.1f}ms "
+          f"spawn_to_ready={results['spawn_to_ready_s'] * 1000:8.1f}ms "
+          f"first_request={results['first_request_ms']:8.1f}ms second_request={results['second_request_ms']:8.1f}ms "
+          f"(median of {len(runs)} runs)")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({"median": results, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# synthetic.py
+"""
+Deterministic offline stand-ins for Yahoo and OpenAI.
+They are only used to record a fixture set the first time the benchmark runs on a
+machine without fixtures; the benchmark itself always replays the recorded files.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+SYMBOLS = ["AAPL", "MSFT", "GOOG", "AMZN", "META", "NFLX", "NVDA", "TSLA"]
+START_DATE, END_DATE = "2024-01-01", "2024-07-01"
+
+
+def _seed(*parts: Any) -> int:
+    return int(hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:8], 16)
+
+
+class SyntheticMarketData:
+    def history(self, symbol: str, start: str, end: str, interval: str = "1d") -> pd.DataFrame:
+        # Always daily bars; the interval only changes how callers chunk their ranges
+        index = pd.bdate_range(start, end, inclusive="left", tz="America/New_York")
+        rng = np.random.default_rng(_seed(symbol))
+        # Generate the full benchmark window so overlapping ranges see consistent prices
+        full = pd.bdate_range("2020-01-01", "2030-01-01", inclusive="left", tz="America/New_York")
+        close = pd.Series(100 * np.cumprod(1 + rng.normal(0.0004, 0.018, len(full))), index=full)
+        close = close.reindex(index)
+        return pd.DataFrame({
+            "Open": close * 0.998, "High": close * 1.012, "Low": close * 0.988, "Close": close,
+            "Volume": rng.integers(5_000_000, 50_000_000, len(index)).astype(float),
+        }, index=index)
+
+    def download(self, symbols: List[str], start: str, end: str) -> pd.DataFrame:
+        return pd.concat({symbol: self.history(symbol, start, end) for symbol in symbols}, axis=1)
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        rng = np.random.default_rng(_seed("info", symbol))
+        return {
+            "marketCap": int(rng.integers(10**11, 3 * 10**12)),
+            "trailingPE": round(float(rng.uniform(10, 60)), 2),
+            "dividendYield": round(float(rng.uniform(0, 0.03)), 4),
+            "trailingEps": round(float(rng.uniform(1, 20)), 2),
+            "fiftyTwoWeekHigh": round(float(rng.uniform(150, 500)), 2),
+            "fiftyTwoWeekLow": round(float(rng.uniform(50, 150)), 2),
+        }
+
+    def recommendations(self, symbol: str) -> pd.DataFrame:
+        return pd.DataFrame([{"period": "0m", "strongBuy": 10, "buy": 20, "hold": 8, "sell": 1, "strongSell": 0}])
+
+    def news(self, symbol: str) -> List[Dict[str, Any]]:
+        # The first article is shared across tickers, as market-wide stories are on Yahoo
+        return [{"title": "Big Tech leads the market higher", "publisher": "Synthetic Wire"}] + \
+            [{"title": f"{symbol} headline {i}", "publisher": "Synthetic Wire"} for i in range(1, 5)]
+
+    def search(self, query: str) -> Dict[str, Any]:
+        return {"quotes": [{"symbol": query.strip().upper()[:4]}]}
+
+
+def _completion(content: str = None, tool_calls: List[Dict] = None) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "synthetic", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_calls else "stop",
+                     "message": {"role": "assistant", "content": content, "tool_calls": tool_calls}}],
+        "usage": {"prompt_tokens": 500, "completion_tokens": 80, "total_tokens": 580},
+    })
+
+
+def _chunks(content: str = None, tool_calls: List[Dict] = None) -> List[ChatCompletionChunk]:
+    deltas = [{"tool_calls": [{"index": i, **call}]} for i, call in enumerate(tool_calls or [])]
+    deltas += [{"content": word + " "} for word in (content or "").split()]
+    return [ChatCompletionChunk.model_validate({
+        "id": "synthetic", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+    }) for delta in deltas]
+
+
+class SyntheticLLM:
+    """
+    Plans one fetch_stock_data call per ticker found in the query (fetch_stock_news when the
+    query mentions news or sentiment), then writes a fixed summary.
+    """
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    def create(self, messages: List[Dict], stream: bool = False, tools: List = None, **kwargs):
+        tool_calls = None
+        if tools and not any(m["role"] in ("function", "tool") for m in messages):
+            symbols = [s for s in re.findall(r"\b[A-Z]{2,5}\b", messages[-1]["content"]) if s in SYMBOLS]
+            if re.search(r"news|sentiment", messages[-1]["content"], re.IGNORECASE):
+                name, arguments = "fetch_stock_news", [{"symbol": s} for s in symbols]
+            else:
+                name, arguments = "fetch_stock_data", [
+                    {"symbol": s, "start_date": START_DATE, "end_date": END_DATE} for s in symbols
+                ]
+            tool_calls = [{
+                "id": f"call_{i}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args)}
+            } for i, args in enumerate(arguments)]
+        content = None if tool_calls else "The stocks trended upward with moderate volatility over the period."
+        if kwargs.get("response_format"):
+            request = json.loads(messages[-1]["content"])
+            content = json.dumps({"scores": {
+                a["id"]: {s: round((_seed(a["headline"], s) % 200) / 100 - 1, 2) for s in a["symbols"]}
+                for a in request["articles"]
+            }, "valuation": {s: "fairly valued" for s in request.get("valuation", {})}})
+        return _chunks(content, tool_calls) if stream else _completion(content, tool_calls)
@@ -0,0 +1,19 @@
+# conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.config reads the environment at import time, so the tests' settings go in first
+_scratch = tempfile.mkdtemp(prefix="stock-analysis-tests-")
+os.environ.update(
+    OPEN_API_KEY="test",
+    LOG_FILE=f"{_scratch}/app.log",
+    BAR_STORE_DIR=f"{_scratch}/bars",
+    SHARED_CACHE_ENABLED="false",
+    SYMBOL_INDEX_CACHE="",
+    WATCHLIST="",
+    WATCHLIST_FILE="",
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,55 @@
+# test_bar_store.py
+import pandas as pd
+
+from app.bar_store import BAR_COLUMNS, BarStore
+
+
+def _bars(start, end):
+    index = pd.bdate_range(start, end, inclusive="left", name="Date")
+    return pd.DataFrame({column: 1.0 for column in BAR_COLUMNS}, index=index)
+
+
+class CountingFetch:
+    """history() stand-in over a calendar where `closed` weekdays have no bars."""
+
+    def __init__(self, closed=()):
+        self.closed = {pd.Timestamp(day) for day in closed}
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        bars = _bars(start, end)
+        return bars[~bars.index.isin(self.closed)]
+
+
+def test_weekend_gap_is_cached(tmp_path):
+    store, fetch = BarStore(str(tmp_path), live_ttl=300), CountingFetch()
+    store.get_history("MSFT", "2024-01-08", "2024-01-13", fetch)
+    for _ in range(2):
+        store.get_history("MSFT", "2024-01-08", "2024-01-15", fetch)
+    assert fetch.calls == [("2024-01-08", "2024-01-13"), ("2024-01-13", "2024-01-15")]
+
+
+def test_holiday_between_held_bars_is_cached(tmp_path):
+    store, fetch = BarStore(str(tmp_path), live_ttl=300), CountingFetch(closed=["2024-01-15"])
+    store.get_history("MSFT", "2024-01-08", "2024-01-13", fetch)
+    store.get_history("MSFT", "2024-01-16", "2024-01-20", fetch)
+    for _ in range(2):
+        store.get_history("MSFT", "2024-01-08", "2024-01-20", fetch)
+    assert fetch.calls[2:] == [("2024-01-13", "2024-01-16")]
+
+
+def test_empty_fetch_of_trading_days_is_retried(tmp_path):
+    store = BarStore(str(tmp_path), live_ttl=300)
+    failed = CountingFetch(closed=pd.bdate_range("2024-01-01", "2024-02-01"))
+    assert store.get_history("MSFT", "2024-01-01", "2024-02-01", failed).empty
+    fetch = CountingFetch()
+    assert len(store.get_history("MSFT", "2024-01-01", "2024-02-01", fetch)) == 23
+    assert fetch.calls == [("2024-01-01", "2024-02-01")]
+
+
+def test_failed_bulk_put_is_not_covered(tmp_path):
+    store = BarStore(str(tmp_path), live_ttl=300)
+    # A symbol that failed in a batched download comes back without rows
+    store.put("MSFT", "2024-01-01", "2024-02-01", pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([])))
+    assert store.missing_ranges("MSFT", "2024-01-01", "2024-02-01") == [("2024-01-01", "2024-02-01")]
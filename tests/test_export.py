@@ -0,0 +1,13 @@
+# test_export.py
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.mark.parametrize("param, value", [("start_date", "2024-13-01"), ("end_date", "yesterday")])
+def test_malformed_dates_are_rejected(param, value):
+    params = {"symbol": "MSFT", "start_date": "2024-01-01", "end_date": "2024-02-01", param: value}
+    response = TestClient(app).get("/export_stock_data/", params=params)
+    assert response.status_code == 400
+    assert param in response.json()["detail"]
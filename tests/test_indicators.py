@@ -0,0 +1,24 @@
+# test_indicators.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.indicators import BARS_PER_YEAR, summarize_history
+from app.services import INTERVAL_CHUNK_DAYS
+
+
+def _bars(index):
+    close = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.002, len(index)))
+    return pd.DataFrame({"Open": close, "High": close * 1.001, "Low": close * 0.999, "Close": close,
+                         "Volume": 1000.0}, index=index)
+
+
+def test_every_interval_can_be_annualized():
+    assert set(INTERVAL_CHUNK_DAYS) <= set(BARS_PER_YEAR)
+
+
+@pytest.mark.parametrize("interval, bars_per_year", [("1d", 252), ("5m", 252 * 78), ("1h", 252 * 6.5)])
+def test_volatility_is_annualized_per_interval(interval, bars_per_year):
+    data = _bars(pd.date_range("2024-01-02 09:30", periods=200, freq="5min"))
+    volatility = summarize_history(data, interval)["volatility"]
+    assert volatility["annualized_pct"] == pytest.approx(volatility["per_bar_pct"] * np.sqrt(bars_per_year), rel=1e-2)
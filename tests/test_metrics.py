@@ -0,0 +1,26 @@
+# test_metrics.py
+import re
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? \S+$")
+
+
+def test_metric_families_are_contiguous():
+    text = TestClient(app).get("/metrics").text
+    seen, family, kind = set(), None, None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, family, kind = line.split()
+            assert family not in seen, f"{family} appears more than once"
+            seen.add(family)
+            continue
+        if not line or line.startswith("#"):
+            continue
+        name = _SAMPLE.match(line).group(1)
+        if kind == "histogram":
+            name = re.sub(r"_(bucket|sum|count)$", "", name)
+        assert name == family, f"sample {name} is outside its family block (under {family})"
+    assert {"cache_hits_total", "cache_misses_total", "cache_entries"} <= seen
@@ -0,0 +1,136 @@
+# test_upstream.py
+import math
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from app import providers, upstream
+from app.bar_store import BAR_COLUMNS, BarStore, market_today
+from app.providers import ResilientMarketData
+from app.services import fetch_stock_fundamentals
+from app.upstream import CircuitOpenError, TokenBucket, TransientUpstreamError, UpstreamPolicy, policies
+
+RETRIES = 2
+FAILURE_THRESHOLD = 2
+RESET_TIMEOUT = 0.1
+
+
+class FlakyMarketData:
+    """Fails its first `failures` calls with `error`, then answers with fixed data."""
+
+    def __init__(self, failures: float = 0, error: Exception = None):
+        self.failures = failures
+        self.error = error or TransientUpstreamError("upstream timed out")
+        self.calls = 0
+
+    def _answer(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return value
+
+    def history(self, symbol, start, end, interval="1d"):
+        index = pd.date_range(start, end, inclusive="left", name="Date")
+        return self._answer(pd.DataFrame({column: 1.0 for column in BAR_COLUMNS}, index=index))
+
+    def info(self, symbol):
+        return self._answer({"marketCap": 1_000_000, "trailingPE": 25.0})
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """A fresh yfinance policy: no rate limit, no backoff delay and a fast circuit reset."""
+    monkeypatch.setattr(upstream, "CIRCUIT_FAILURE_THRESHOLD", FAILURE_THRESHOLD)
+    monkeypatch.setattr(upstream, "CIRCUIT_RESET_TIMEOUT", RESET_TIMEOUT)
+    policy = UpstreamPolicy("yfinance", concurrency=4, rate=0, retries=RETRIES, backoff_base=0)
+    monkeypatch.setitem(policies, "yfinance", policy)
+    return policy
+
+
+def test_transient_errors_are_retried(policy):
+    flaky = FlakyMarketData(failures=RETRIES)
+    info = ResilientMarketData(flaky).info("MSFT")
+    assert info["marketCap"] == 1_000_000
+    assert flaky.calls == RETRIES + 1
+    assert policy.breaker.state == "closed"
+
+
+def test_retries_stop_after_the_limit(policy):
+    flaky = FlakyMarketData(failures=math.inf)
+    with pytest.raises(TransientUpstreamError):
+        ResilientMarketData(flaky).info("MSFT")
+    assert flaky.calls == RETRIES + 1
+
+
+def test_other_errors_are_not_retried(policy):
+    flaky = FlakyMarketData(failures=math.inf, error=KeyError("marketCap"))
+    with pytest.raises(KeyError):
+        ResilientMarketData(flaky).info("MSFT")
+    assert flaky.calls == 1
+    assert policy.breaker.state == "closed"
+
+
+def test_circuit_opens_then_recovers(policy):
+    flaky = FlakyMarketData(failures=math.inf)
+    market = ResilientMarketData(flaky)
+    for _ in range(FAILURE_THRESHOLD):
+        with pytest.raises(TransientUpstreamError):
+            market.info("MSFT")
+    assert policy.breaker.state == "open"
+
+    calls = flaky.calls
+    with pytest.raises(CircuitOpenError):
+        market.info("MSFT")
+    assert flaky.calls == calls
+
+    # After the reset timeout one trial call goes through; a failure opens the circuit again
+    time.sleep(RESET_TIMEOUT)
+    with pytest.raises(TransientUpstreamError):
+        market.info("MSFT")
+    assert policy.breaker.state == "open"
+
+    time.sleep(RESET_TIMEOUT)
+    flaky.failures = 0
+    assert market.info("MSFT")["trailingPE"] == 25.0
+    assert policy.breaker.state == "closed"
+
+
+def test_token_bucket_spaces_calls_after_the_burst():
+    bucket = TokenBucket(rate=50, burst=2)
+    started = time.monotonic()
+    # Two calls ride the burst, the next three each wait 1/50s for a token
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started >= 3 / 50 - 0.005
+
+
+def test_stale_bars_are_served_when_a_refresh_fails(policy, tmp_path):
+    flaky = FlakyMarketData()
+    market = ResilientMarketData(flaky)
+    # A zero live TTL makes every read refetch today's provisional bar
+    store = BarStore(str(tmp_path), live_ttl=0)
+    today = market_today()
+    start, end = today.isoformat(), (today + timedelta(days=1)).isoformat()
+
+    def fetch(gap_start, gap_end):
+        return market.history("MSFT", gap_start, gap_end)
+
+    assert len(store.get_history("MSFT", start, end, fetch)) == 1
+    flaky.failures = math.inf
+    stale = store.get_history("MSFT", start, end, fetch)
+    assert len(stale) == 1
+    assert flaky.calls == 1 + RETRIES + 1
+
+
+def test_stale_cache_entries_are_served_when_a_refresh_fails(policy, monkeypatch):
+    flaky = FlakyMarketData()
+    monkeypatch.setattr(providers, "_market_data", ResilientMarketData(flaky))
+    # Loaded already expired, but kept for stale serving
+    fetch_stock_fundamentals.refresh(("STALE",), ttl=0)
+
+    flaky.failures = math.inf
+    fundamentals = fetch_stock_fundamentals("STALE")
+    assert fundamentals["Market Cap"] == 1_000_000
+    assert flaky.calls == 1 + RETRIES + 1